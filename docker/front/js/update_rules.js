@@ -1,28 +1,50 @@
 function updateRules() {
-    document.getElementById("updateRulesStatus").innerText = "Updating rules";
-    var dots = 0;
-    var intervalId = setInterval(function() {
-        document.getElementById("updateRulesStatus").innerText += ".";
-        dots++;
-    }, 1000);
+    document.getElementById("updateRulesStatus").innerText = "Starting rule update";
 
     fetch('http://127.0.0.1:8000/api/v1/update-rules', {
-        method: 'GET',
+        method: 'POST',
     })
     .then(response => response.json())
     .then(data => {
-        clearInterval(intervalId);
-        var formattedResponse = data.response.replace(/\n/g, '<br>');
-        document.getElementById("updateRulesStatus").innerText = "Update complete!";
-        document.getElementById("updateRulesResponse").innerHTML = "<code>" + formattedResponse + "</code>";
+        if (data.job_id === undefined) {
+            throw new Error(data.message);
+        }
+        if (data.error) {
+            document.getElementById("updateRulesStatus").innerText = "Another update is running, showing its progress";
+        }
+        pollRuleUpdate(data.job_id);
     })
     .catch((error) => {
         console.error('Error:', error);
-        clearInterval(intervalId);
         document.getElementById("updateRulesStatus").innerText = "Update failed. Please try again.";
     });
 }
 
+function pollRuleUpdate(jobId) {
+    fetch('http://127.0.0.1:8000/api/v1/update-rules/' + jobId)
+    .then(response => response.json())
+    .then(job => {
+        var formattedResponse = job.output.replace(/\n/g, '<br>');
+        document.getElementById("updateRulesResponse").innerHTML = "<code>" + formattedResponse + "</code>";
+
+        if (job.status === 'succeeded') {
+            var counts = job.counts;
+            document.getElementById("updateRulesStatus").innerText = "Update complete! Rules added: " + counts.added +
+                ", updated: " + counts.updated + ", unchanged: " + counts.unchanged + ", failed: " + counts.failed;
+        } else if (job.status === 'failed') {
+            document.getElementById("updateRulesStatus").innerText = "Update failed: " + job.error;
+        } else {
+            var progress = job.phase === 'rule_reader' ? " (" + job.rules_processed + " rules processed)" : "";
+            document.getElementById("updateRulesStatus").innerText = "Updating rules: " + job.phase + progress;
+            setTimeout(function() { pollRuleUpdate(jobId); }, 2000);
+        }
+    })
+    .catch((error) => {
+        console.error('Error:', error);
+        document.getElementById("updateRulesStatus").innerText = "Lost track of the update. Please reload the page.";
+    });
+}
+
 function addRule() {
     var rule = document.getElementById("ruleInput").value;
     if (!rule) {
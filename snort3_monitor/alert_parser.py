@@ -0,0 +1,97 @@
+"""
+Parsing of Snort alert_json lines.
+
+Kept free of database access, so parsing speed can be measured on its own:
+    python alert_parser.py ../snort_logs/alert_json.txt
+
+If orjson is installed it is used to decode lines, otherwise the standard json module is used.
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from django.utils.timezone import make_aware
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SNORT_TIMESTAMP_FORMAT = '%y/%m/%d-%H:%M:%S'
+
+load_json = orjson.loads if orjson is not None else json.loads
+
+
+class SnortTimestampParser:
+    """
+    Parser of Snort alert timestamps, e.g. "24/01/15-10:00:00.123456".
+
+    Thousands of alerts share the same second, so the timezone-aware datetime of the last parsed second is cached
+    and only the microseconds are parsed for the following alerts of that second.
+    One instance should be used by one thread.
+    """
+    def __init__(self):
+        self._second = None
+        self._value = None
+
+    def parse(self, timestamp: str) -> datetime:
+        """Return timezone-aware datetime for the Snort timestamp, raise ValueError if it is invalid"""
+        second, _, fraction = timestamp.partition('.')
+        if second != self._second:
+            self._value = make_aware(datetime.strptime(second, SNORT_TIMESTAMP_FORMAT))
+            self._second = second
+
+        if not fraction.isdigit():
+            raise ValueError(f'Invalid fraction of a second in timestamp "{timestamp}"')
+        return self._value.replace(microsecond=int(fraction[:6].ljust(6, '0')))
+
+
+default_timestamp_parser = SnortTimestampParser()
+
+
+def parse_alert(line, timestamp_parser: SnortTimestampParser = default_timestamp_parser) -> dict:
+    """
+    Decode one alert_json line.
+
+    :param line: line of alert_json.txt as str or bytes
+    :param timestamp_parser: parser to use, every thread should pass its own instance
+    :return: dict with gid, sid, rev of the rule and the Event field values
+    :raise ValueError: if the line is not valid json or the timestamp is invalid
+    :raise KeyError: if a required field is missing
+    """
+    alert_data = load_json(line)
+
+    return {
+        'gid': alert_data['gid'],
+        'sid': alert_data['sid'],
+        'rev': alert_data['rev'],
+        'timestamp': timestamp_parser.parse(alert_data['timestamp']),
+        'src_addr': alert_data['src_addr'],
+        'src_port': alert_data.get('src_port'),
+        'dst_addr': alert_data['dst_addr'],
+        'dst_port': alert_data.get('dst_port'),
+        'proto': alert_data['proto'],
+    }
+
+
+if __name__ == '__main__':
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "snort3_monitor.settings")
+
+    with open(sys.argv[1], 'rb') as file:
+        lines = file.readlines()
+
+    invalid = 0
+    start = time.perf_counter()
+    for line in lines:
+        try:
+            parse_alert(line)
+        except (KeyError, TypeError, ValueError):
+            invalid += 1
+    elapsed = time.perf_counter() - start
+
+    decoder = 'orjson' if orjson is not None else 'json'
+    print(f'Parsed {len(lines)} lines ({invalid} invalid) in {elapsed:.3f}s '
+          f'({len(lines) / elapsed:.0f} lines/s, {decoder} decoder)')
@@ -1,13 +1,23 @@
+import argparse
+import bisect
+import io
 import json
 import logging
 import os
-import sys
+import queue
+import selectors
+import socket
+import threading
 import time
-from datetime import datetime
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from typing import NamedTuple
 
 import django
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.utils.timezone import make_aware
+from django.db import DatabaseError, InterfaceError, OperationalError, connection, transaction
+from django.utils.timezone import now
 
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
@@ -15,89 +25,902 @@ from watchdog.observers import Observer
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "snort3_monitor.settings")
 django.setup()
 
-from event.models import Event, Rule
+from alert_parser import SnortTimestampParser, parse_alert
+from event.models import DataVersion, DeletionWatermark, Event, ReaderCheckpoint, Rule
+from event.rollups import add_counts, lock_rollups, rebuild_rollups
 
 
 alert_reader_logger = logging.getLogger(__name__)
 alert_reader_logger.setLevel(logging.INFO)
 
-f_handler = logging.FileHandler('../log_files/alert_reader.log')
+f_handler = logging.FileHandler(settings.BASE_DIR.parent / 'log_files' / 'alert_reader.log')
 f_handler.setLevel(logging.INFO)
 f_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 f_handler.setFormatter(f_format)
 alert_reader_logger.addHandler(f_handler)
 
+LEGACY_LINES_COUNT_PATH = '../snort_logs/lines_count.txt'
+CHECKPOINT_SOURCE = 'alert_json'
+BATCH_SIZE = 500
+BATCH_TIMEOUT = 1
+RULE_INDEX_REFRESH_INTERVAL = 10
+EVENT_WRITER = 'auto'
+QUEUE_SIZE = 20
+WRITER_THREADS = 1
+STATUS_INTERVAL = 5
+RETRY_DELAY = 5
+AGGREGATION_WINDOW = settings.ALERT_AGGREGATION_WINDOW
+MAX_RECORD_SIZE = 65536
+SECONDS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300]
 
-class Handler(FileSystemEventHandler):
+
+class Batch(NamedTuple):
     """
-    Event handler to track the update of the alert_json.txt file and write new Snort events to the database
+    Events read from the alert file up to the given position, numbered in reading order.
+    updates holds (event, count, last_seen) of aggregated events written by earlier batches.
+    """
+    seq: int
+    events: list
+    updates: list
+    inode: int
+    offset: int
+
+
+class CommitOrder:
+    """
+    Lets writer threads commit batches in reading order.
+    Events of several batches are inserted in parallel, but the checkpoint of a batch is written and committed only
+    after all previous batches, so a saved position never covers an uncommitted batch.
+    """
+    def __init__(self):
+        self.next_seq = 0
+        self._condition = threading.Condition()
+
+    def wait_turn(self, seq: int):
+        """Blocks until all batches before seq are committed"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.next_seq == seq)
+
+    def finish_turn(self, seq: int):
+        """Marks batch seq as done once its turn has come and wakes up the writer of the next one"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.next_seq == seq)
+            self.next_seq = seq + 1
+            self._condition.notify_all()
+
+
+class AlertAggregator:
+    """
+    Folds alerts with the same rule, source and destination address and protocol into one event while they arrive
+    within AGGREGATION_WINDOW seconds after the first of them.
+
+    The first alert of a group is written as a new event. Alerts folded into it later only change its count and
+    last_seen, which are written as updates with the batch that is being collected when they arrive.
+
+    Attributes:
+    - window (timedelta): time after the first alert of a group during which identical alerts are folded
+    - groups (dict): open group [event, count, last_seen] by (rule, src_addr, dst_addr, proto)
+    - changed (dict): groups folded into since the last batch, by id
+    - latest (datetime): timestamp of the latest alert, used to close expired groups
+    """
+    def __init__(self, window: float):
+        self.window = timedelta(seconds=window)
+        self.groups = {}
+        self.changed = {}
+        self.latest = None
+
+    def add(self, event) -> bool:
+        """Folds the event into an open group and returns True, or opens a new group for it and returns False"""
+        if self.latest is None or event.timestamp > self.latest:
+            self.latest = event.timestamp
+
+        key = (event.rule_id_id, event.src_addr, event.dst_addr, event.proto)
+        group = self.groups.get(key)
+        if group is None or not timedelta(0) <= event.timestamp - group[0].timestamp <= self.window:
+            self.groups[key] = [event, 1, None]
+            return False
+
+        group[1] += 1
+        group[2] = max(group[2] or event.timestamp, event.timestamp)
+        self.changed[id(group)] = group
+        return True
+
+    def take_updates(self, events) -> list:
+        """
+        Sets count and last_seen of the new events of a batch from their groups, closes expired groups.
+        Returns (event, count, last_seen) of changed groups written by earlier batches.
+        """
+        new_events = {id(event) for event in events}
+        updates = []
+        for event, count, last_seen in self.changed.values():
+            if id(event) in new_events:
+                event.count, event.last_seen = count, last_seen
+            else:
+                updates.append((event, count, last_seen))
+        self.changed = {}
+
+        if self.latest is not None:
+            self.groups = {key: group for key, group in self.groups.items()
+                           if self.latest - group[0].timestamp <= self.window}
+        return updates
+
+
+class Histogram:
+    """Histogram of durations in seconds with fixed bucket bounds, not thread-safe on its own"""
+    def __init__(self, bounds=SECONDS_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        """Add one value"""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def to_dict(self) -> dict:
+        """Return cumulative counts per upper bound ("le") with count, sum and max"""
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip([*self.bounds, '+Inf'], self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {'buckets': buckets, 'count': self.count, 'sum': round(self.sum, 6), 'max': round(self.max, 6)}
+
+
+class IngestMetrics:
+    """
+    Counters and histograms of alert_reader, updated by the reader and writer threads.
+
+    Attributes:
+    - lines_read (int): complete lines read from alert_json.txt
+    - parse_failures (int): lines that could not be parsed
+    - unknown_rules (int): alerts skipped because their rule is unknown
+    - events_committed (int): events written to the database
+    - events_failed (int): events rejected by the database
+    - batch_commit_seconds (Histogram): time to write and commit one batch
+    - commit_lag_seconds (Histogram): time between the Snort timestamp of an event and its commit
+    """
+    def __init__(self):
+        self.started_at = now()
+        self.lines_read = 0
+        self.parse_failures = 0
+        self.unknown_rules = 0
+        self.events_committed = 0
+        self.events_failed = 0
+        self.last_commit_at = None
+        self.batch_commit_seconds = Histogram()
+        self.commit_lag_seconds = Histogram()
+        self._lock = threading.Lock()
+        self._rate_lines = 0
+        self._rate_time = time.monotonic()
+
+    def count_read(self, lines: int, parse_failures: int, unknown_rules: int):
+        """Add results of one read cycle"""
+        with self._lock:
+            self.lines_read += lines
+            self.parse_failures += parse_failures
+            self.unknown_rules += unknown_rules
+
+    def count_commit(self, events, saved: int, seconds: float):
+        """Add results of one written batch"""
+        committed_at = now()
+        with self._lock:
+            self.events_committed += saved
+            self.events_failed += len(events) - saved
+            self.last_commit_at = committed_at
+            self.batch_commit_seconds.observe(seconds)
+            for event in events:
+                self.commit_lag_seconds.observe((committed_at - event.timestamp).total_seconds())
+
+    def to_dict(self) -> dict:
+        """Return all metrics with the lines per second rate since the previous call"""
+        with self._lock:
+            current_time = time.monotonic()
+            lines_per_sec = (self.lines_read - self._rate_lines) / max(current_time - self._rate_time, 1e-6)
+            self._rate_lines, self._rate_time = self.lines_read, current_time
+
+            return {
+                'started_at': self.started_at.isoformat(),
+                'lines_read': self.lines_read,
+                'lines_per_sec': round(lines_per_sec, 1),
+                'parse_failures': self.parse_failures,
+                'unknown_rules': self.unknown_rules,
+                'events_committed': self.events_committed,
+                'events_failed': self.events_failed,
+                'last_commit_at': self.last_commit_at.isoformat() if self.last_commit_at else None,
+                'batch_commit_seconds': self.batch_commit_seconds.to_dict(),
+                'commit_lag_seconds': self.commit_lag_seconds.to_dict(),
+            }
+
+
+class RuleIndex:
+    """
+    In-memory index of rule keys ("gid/sid/rev"), the primary keys of the Rule model.
+
+    The keys are loaded once and reloaded only when rule_reader bumps the rules DataVersion, so turning an alert
+    into a Rule reference costs a set lookup. Keys of unknown rules are remembered until the next reload, so
+    repeated alerts for a missing rule do not query the database for every line.
+
+    Attributes:
+    - keys (set): known rule keys
+    - misses (set): keys that were not found since the last reload
+    - version (int): rules DataVersion the keys were loaded at
+    - checked (float): monotonic time of the last version check
+    """
+    def __init__(self):
+        self.keys = set()
+        self.misses = set()
+        self.version = None
+        self.checked = 0
+        self.reload()
+
+    def reload(self):
+        """Load all rule keys from DB"""
+        self.version = DataVersion.get_version(DataVersion.RULES)
+        self.keys = set(Rule.objects.values_list('id', flat=True))
+        self.misses = set()
+        self.checked = time.monotonic()
+        alert_reader_logger.info(f'Rule index loaded: {len(self.keys)} rules, version {self.version}')
+
+    def refresh(self):
+        """Reload the keys if rules were changed since the last load"""
+        self.checked = time.monotonic()
+        if DataVersion.get_version(DataVersion.RULES) != self.version:
+            self.reload()
+
+    def refresh_if_due(self):
+        """Check the rules version if RULE_INDEX_REFRESH_INTERVAL has passed since the last check"""
+        if time.monotonic() - self.checked >= RULE_INDEX_REFRESH_INTERVAL:
+            self.refresh()
+
+    def resolve(self, gid, sid, rev):
+        """Return Rule primary key for the alert or None if the rule is unknown"""
+        key = f'{gid}/{sid}/{rev}'
+        if key in self.keys:
+            return key
+
+        if key in self.misses:
+            self.refresh_if_due()
+        else:
+            self.refresh()
+        if key in self.keys:
+            return key
+
+        if key not in self.misses:
+            self.misses.add(key)
+            alert_reader_logger.warning(f'Unknown rule {key}, its alerts are skipped until rules are updated')
+        return None
+
+
+def is_connection_error(error: DatabaseError) -> bool:
+    """
+    Returns True if the error means the connection was lost or the transaction of the batch can not go on.
+    Such errors are re-raised by event writers for write_batch to retry the batch, only data errors are handled
+    by writing row by row.
+    """
+    return isinstance(error, (OperationalError, InterfaceError)) or connection.needs_rollback
+
+
+class OrmEventWriter:
+    """Writes a batch of events with one bulk_create inside one transaction"""
+    name = 'orm'
+
+    def write(self, events) -> int:
+        """Writes events and returns the number of saved ones"""
+        try:
+            with transaction.atomic():
+                Event.objects.bulk_create(events)
+            return len(events)
+        except DatabaseError as e:
+            if is_connection_error(e):
+                raise
+            alert_reader_logger.warning(f'Batch of {len(events)} events was rejected, retrying row by row: {e}')
+        return self.write_rows(events)
+
+    @staticmethod
+    def write_rows(events) -> int:
+        """Writes events one by one under savepoints so that only invalid rows are logged and skipped"""
+        saved = 0
+        with transaction.atomic():
+            for event in events:
+                try:
+                    with transaction.atomic():
+                        event.save()
+                    saved += 1
+                except DatabaseError as e:
+                    if is_connection_error(e):
+                        raise
+                    alert_reader_logger.error(f'Error saving event {event.timestamp} {event.rule_id_id} '
+                                              f'{event.src_addr} -> {event.dst_addr}: {e}')
+        return saved
+
+
+class CopyEventWriter(OrmEventWriter):
+    """
+    Streams a batch of events into PostgreSQL with COPY FROM STDIN.
+    A batch rejected by COPY is retried row by row through the ORM.
+    """
+    name = 'copy'
+
+    def __init__(self):
+        self.fields = [field for field in Event._meta.concrete_fields if not field.primary_key]
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in self.fields)
+        self.sql = f'COPY {connection.ops.quote_name(Event._meta.db_table)} ({columns}) FROM STDIN'
+
+    @staticmethod
+    def format_value(value) -> str:
+        """Formats a value for the COPY text format"""
+        if value is None:
+            return '\\N'
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+                .replace('\n', '\\n').replace('\r', '\\r'))
+
+    def write(self, events) -> int:
+        buffer = io.StringIO()
+        for event in events:
+            values = (field.get_db_prep_save(getattr(event, field.attname), connection) for field in self.fields)
+            buffer.write('\t'.join(self.format_value(value) for value in values) + '\n')
+        buffer.seek(0)
+
+        try:
+            with transaction.atomic(), connection.cursor() as cursor, connection.wrap_database_errors:
+                cursor.cursor.copy_expert(self.sql, buffer)
+            return len(events)
+        except DatabaseError as e:
+            if is_connection_error(e):
+                raise
+            alert_reader_logger.warning(f'COPY of {len(events)} events was rejected, retrying row by row: {e}')
+        return self.write_rows(events)
+
+
+def get_event_writer():
+    """
+    Returns the COPY writer on PostgreSQL and the ORM writer on other databases, unless EVENT_WRITER is set.
+    Aggregation needs primary keys of written events to update them, which COPY does not return, so the ORM
+    writer is always used with AGGREGATION_WINDOW.
+    """
+    backend = EVENT_WRITER
+    if AGGREGATION_WINDOW:
+        backend = 'orm'
+    elif backend == 'auto':
+        backend = 'copy' if connection.vendor == 'postgresql' else 'orm'
+
+    writer = CopyEventWriter() if backend == 'copy' else OrmEventWriter()
+    alert_reader_logger.info(f'Using {writer.name} event writer')
+    return writer
+
+
+class AlertPipeline(ABC):
+    """
+    Parses alert records of a source and writes them to the database as Snort events.
+
+    The reader thread of a subclass reads and parses records and collects them into batches of up to BATCH_SIZE
+    events or BATCH_TIMEOUT seconds. Batches go through a queue bounded by QUEUE_SIZE to WRITER_THREADS writer
+    threads, each writing a batch in one transaction. When the database falls behind, the full queue blocks the
+    reader instead of buffering alerts in memory.
+
+    Every batch carries the position of the source right after its last record. The writer saves it as
+    ReaderCheckpoint in the transaction of the batch, and batches are committed in reading order, so after a crash
+    or SIGKILL reading resumes exactly after the last committed event. SQLite allows only one writing transaction,
+    so there a single writer thread is used.
+
+    With AGGREGATION_WINDOW set, identical alerts are folded into one event by AlertAggregator.
 
     Attributes:
-    - lines_count (int): indicates the last saved line
-    - lines_count_file_path (str): path to txt-file for saving lines_count in case of program restart
+    - next_seq (int): sequence number of the next queued batch
+    - queued_position (tuple): position of the last queued batch
+    - commit_order (CommitOrder): makes writer threads commit batches in reading order
+    - batch (list): parsed events waiting to be written to the database
+    - batch_started (float): monotonic time when the first event of the current batch was added
+    - rule_index (RuleIndex): rule keys used to resolve alerts without querying the database
+    - aggregator (AlertAggregator): folds identical alerts, None if AGGREGATION_WINDOW is 0
+    - timestamp_parser (SnortTimestampParser): timestamp parser of the reader thread
+    - writer (OrmEventWriter): backend used to write batches to the database
+    - queue (queue.Queue): batches waiting for the writer threads
+    - metrics (IngestMetrics): counters published to settings.INGEST_STATUS_FILE for the API
     """
     def __init__(self):
-        self.lines_count = 0
-        self.lines_count_file_path = '../snort_logs/lines_count.txt'
-        self.upload_lines_count(self.lines_count_file_path)
+        self.next_seq = 0
+        self.queued_position = self.position()
+        self.commit_order = CommitOrder()
+        self.batch = []
+        self.batch_started = None
+        self.rule_index = RuleIndex()
+        self.aggregator = AlertAggregator(AGGREGATION_WINDOW) if AGGREGATION_WINDOW else None
+        self.timestamp_parser = SnortTimestampParser()
+        self.metrics = IngestMetrics()
+        self._parse_failures = 0
+        self._unknown_rules = 0
+        self.writer = get_event_writer()
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._stopping = threading.Event()
+        self._reader = threading.Thread(target=self.read_alerts, name='alert-reader')
+        self._writers = [threading.Thread(target=self.write_batches, name=f'event-writer-{number}')
+                         for number in range(WRITER_THREADS if connection.vendor == 'postgresql' else 1)]
+
+    def position(self) -> tuple:
+        """Returns inode and offset of the source after the last read record, (None, None) if it has none"""
+        return None, None
+
+    def start(self):
+        """Starts reader and writer threads"""
+        for thread in self._writers:
+            thread.start()
+        self._reader.start()
+
+    def stop(self):
+        """Stops the reader, waits until writers have written all queued batches"""
+        self._stopping.set()
+        self._reader.join()
+
+        for _ in self._writers:
+            self.queue.put(None)
+        for thread in self._writers:
+            thread.join()
+
+    @abstractmethod
+    def read_alerts(self):
+        """Reader thread: reads records until stopped and passes full or expired batches to the queue"""
+
+    def write_batches(self):
+        """Writer thread: writes batches from the queue until it receives None"""
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+
+            try:
+                self.write_batch(batch)
+            except Exception as e:
+                alert_reader_logger.exception(f'Error writing batch of {len(batch.events)} events, dropped: {e}')
+
+        connection.close()
+
+    @staticmethod
+    def save_updates(updates):
+        """Writes count and last_seen of aggregated events, their earlier batches must be committed"""
+        rows = [Event(id=event.pk, count=count, last_seen=last_seen)
+                for event, count, last_seen in updates if event.pk is not None]
+        if rows:
+            Event.objects.bulk_update(rows, ['count', 'last_seen'])
+
+    @staticmethod
+    def save_rollups(batch, saved: int):
+        """
+        Adds the counts of the saved events and the count increments of updated live events to the rollups.
+        Must be called in the transaction of the batch after save_updates, when earlier batches are committed.
+        """
+        events = batch.events if saved == len(batch.events) else [event for event in batch.events if event.pk]
+        increments = [(event, event.count) for event in events]
+
+        updated = {event.pk for event, _, _ in batch.updates if event.pk is not None}
+        if updated:
+            live = set(Event.objects.live().filter(pk__in=updated).values_list('pk', flat=True))
+            increments += [(event, count - event.count) for event, count, _ in batch.updates if event.pk in live]
+        add_counts(increments)
+
+    @staticmethod
+    def save_checkpoint(batch):
+        """Save the position after the batch, must be called in the transaction of the batch"""
+        if batch.offset is not None:
+            ReaderCheckpoint(source=CHECKPOINT_SOURCE, inode=batch.inode, offset=batch.offset).save()
+
+    def count_read(self, lines):
+        """Passes counts of the current read cycle to metrics"""
+        self.metrics.count_read(lines, self._parse_failures, self._unknown_rules)
+        self._parse_failures = self._unknown_rules = 0
+
+    def parse_alert(self, line):
+        """Parses one alert line into an unsaved Event, returns None if the line is invalid or its rule is unknown"""
+        try:
+            alert = parse_alert(line, self.timestamp_parser)
+
+            rule_id = self.rule_index.resolve(alert.pop('gid'), alert.pop('sid'), alert.pop('rev'))
+            if rule_id is None:
+                self._unknown_rules += 1
+                return None
+
+            return Event(rule_id_id=rule_id, **alert)
+
+        except (KeyError, TypeError, ValueError, ValidationError) as e:
+            self._parse_failures += 1
+            alert_reader_logger.error(f"Error processing alert: {line.decode(errors='replace')}")
+            alert_reader_logger.error(f"Error details: {e}")
+
+    def add_to_batch(self, event):
+        """Adds event to the current batch unless it was folded into an open group, queues the batch once it is full"""
+        if self.aggregator is not None and self.aggregator.add(event):
+            return
+
+        if not self.batch:
+            self.batch_started = time.monotonic()
+        self.batch.append(event)
+
+        if len(self.batch) >= BATCH_SIZE:
+            self.flush()
+
+    def flush_if_due(self):
+        """
+        Queues the current batch if it is older than BATCH_TIMEOUT, picks up rule updates.
+        If only skipped or folded lines were read since the last batch, a batch without new events is queued
+        to move the checkpoint and write the folded counts.
+        """
+        self.rule_index.refresh_if_due()
+        if self.batch:
+            if time.monotonic() - self.batch_started >= BATCH_TIMEOUT:
+                self.flush()
+        elif self.position() != self.queued_position:
+            self.flush()
+
+    def flush(self):
+        """Queues the current batch with the position after it and starts a new one, blocks while the queue is full"""
+        events, self.batch = self.batch, []
+        updates = self.aggregator.take_updates(events) if self.aggregator is not None else []
+        position = self.position()
+        if events or updates or position != self.queued_position:
+            self.queue.put(Batch(self.next_seq, events, updates, *position))
+            self.next_seq += 1
+            self.queued_position = position
+
+    def write_batch(self, batch):
+        """
+        Writes events of the batch, their rollups and its checkpoint in one transaction, committed after all
+        previous batches, and bumps the events DataVersion if the batch changed events.
+        If the events PATCH moved the deletion watermark while the batch was written, its events may be hidden
+        or not, so the rollups are rebuilt from the live events instead of adding the batch.
+        While the connection to the database is lost the transaction is retried every RETRY_DELAY seconds, so
+        the checkpoint never moves past events that were not written. Other database errors are not retried,
+        the batch is logged and dropped by write_batches and the checkpoint of the next batch moves past it.
+        Logs and counts how many events were saved.
+        """
+        start = time.monotonic()
+        try:
+            while True:
+                try:
+                    with transaction.atomic():
+                        watermark = DeletionWatermark.get_last_id(DeletionWatermark.EVENTS)
+                        saved = self.writer.write(batch.events) if batch.events else 0
+                        self.commit_order.wait_turn(batch.seq)
+                        lock_rollups()
+                        self.save_updates(batch.updates)
+                        if DeletionWatermark.get_last_id(DeletionWatermark.EVENTS) == watermark:
+                            self.save_rollups(batch, saved)
+                        else:
+                            rebuild_rollups()
+                        if saved or batch.updates:
+                            DataVersion.bump(DataVersion.EVENTS)
+                        self.save_checkpoint(batch)
+                    for event, count, _ in batch.updates:
+                        event.count = count
+                    break
+                except (OperationalError, InterfaceError) as e:
+                    alert_reader_logger.error(f'Error committing batch of {len(batch.events)} events, '
+                                              f'retrying in {RETRY_DELAY}s: {e}')
+                    for event in batch.events:
+                        event.pk = None
+                    connection.close_if_unusable_or_obsolete()
+                    time.sleep(RETRY_DELAY)
+        finally:
+            self.commit_order.finish_turn(batch.seq)
+
+        if not batch.events:
+            return
+        self.metrics.count_commit(batch.events, saved, time.monotonic() - start)
+        if saved == len(batch.events):
+            alert_reader_logger.info(f'DB updated with {saved} events')
+        else:
+            alert_reader_logger.warning(f'DB updated with {saved} of {len(batch.events)} events, '
+                                        f'{len(batch.events) - saved} failed')
+
+    def source_status(self) -> dict:
+        """Returns the state of the source for publish_status"""
+        return {}
+
+    def publish_status(self):
+        """Writes metrics and the state of the source to settings.INGEST_STATUS_FILE, replacing it atomically"""
+        status = {
+            'published_at': now().isoformat(),
+            **self.source_status(),
+            'queued_batches': self.queue.qsize(),
+            'writer': self.writer.name,
+            **self.metrics.to_dict(),
+        }
+
+        temp_path = f'{settings.INGEST_STATUS_FILE}.tmp'
+        try:
+            with open(temp_path, 'w') as file:
+                json.dump(status, file)
+            os.replace(temp_path, settings.INGEST_STATUS_FILE)
+        except OSError as e:
+            alert_reader_logger.error(f'Error publishing ingest status: {e}')
+
+
+class Handler(AlertPipeline, FileSystemEventHandler):
+    """
+    Event handler to track the update of the alert_json.txt file and write new Snort events to the database
+
+    The file is tailed by byte offset: on every modification the reader seeks straight to the first unread byte,
+    so the cost of one cycle depends only on the amount of new data, not on the size of the file. A trailing line
+    without a newline is left for the next cycle. A new inode (rotation) or a size below the offset (truncation)
+    restarts reading from the beginning of the file. Watchdog callbacks only signal the reader thread that new data
+    exists.
+
+    Attributes:
+    - file_path (str): path to alert_json.txt
+    - offset (int): byte position right after the last complete line that was processed
+    - inode (int): inode of the file the offset belongs to
+    - size (int): size of the file observed during the last cycle
+    - skip_lines (int): lines to skip on the first read when resuming from the legacy lines_count.txt
+    - new_data (threading.Event): set by watchdog callbacks when the file was created or modified
+    """
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.offset = 0
+        self.inode = None
+        self.size = 0
+        self.skip_lines = 0
+        self.load_checkpoint()
+        self.new_data = threading.Event()
+        super().__init__()
 
     def on_created(self, event):
         if event.src_path.endswith('alert_json.txt'):
             alert_reader_logger.info('alert_json.txt was created')
-            self.process_alerts(event.src_path)
+            self.new_data.set()
 
     def on_modified(self, event):
         if event.src_path.endswith('alert_json.txt'):
-            alert_reader_logger.info('alert_json.txt was modified')
-            self.process_alerts(event.src_path)
+            self.new_data.set()
+
+    def position(self) -> tuple:
+        return self.inode, self.offset
+
+    def start(self):
+        """Starts reader and writer threads, reading whatever was written while the program was stopped"""
+        self.new_data.set()
+        super().start()
+
+    def stop(self):
+        self.new_data.set()
+        super().stop()
+
+    def read_alerts(self):
+        """Reader thread: reads new alerts when signalled and passes full or expired batches to the queue"""
+        while not self._stopping.is_set():
+            try:
+                if self.new_data.wait(BATCH_TIMEOUT):
+                    self.new_data.clear()
+                    self.process_alerts(self.file_path)
+                self.flush_if_due()
+            except Exception as e:
+                alert_reader_logger.exception(f'Error reading alerts: {e}')
+                time.sleep(BATCH_TIMEOUT)
 
-    def upload_lines_count(self, file_path):
-        """Read last saved lines_count from file"""
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as file:
-                self.lines_count = int(file.readline())
-                alert_reader_logger.info(f'Lines count file was read. Current position - line {self.lines_count}')
+        self.flush()
+        connection.close()
+
+    def load_checkpoint(self):
+        """Read the position of the last committed batch, falling back to lines_count.txt of older versions"""
+        checkpoint = ReaderCheckpoint.objects.filter(source=CHECKPOINT_SOURCE).first()
+        if checkpoint is not None:
+            self.offset = checkpoint.offset
+            self.inode = checkpoint.inode
+            alert_reader_logger.info(f'Checkpoint was read. Current position - byte {self.offset}')
+
+        elif os.path.exists(LEGACY_LINES_COUNT_PATH):
+            with open(LEGACY_LINES_COUNT_PATH, 'r') as file:
+                self.skip_lines = int(file.readline())
+            alert_reader_logger.info(f'Lines count file was read. Skipping first {self.skip_lines} lines')
 
     def process_alerts(self, file_path):
-        """Reads alert data from lines_count to end, updates lines_count, saves alert data to DB"""
-        with open(file_path, 'r') as input_file:
-            all_lines = input_file.readlines()
+        """Reads complete alert lines written after the saved offset, updates offset, saves alert data to DB"""
+        try:
+            file_stat = os.stat(file_path)
+        except FileNotFoundError:
+            return
+
+        if file_stat.st_ino != self.inode or file_stat.st_size < self.offset:
+            if self.inode is not None:
+                alert_reader_logger.info('alert_json.txt was rotated or truncated, reading from the beginning')
+            self.inode = file_stat.st_ino
+            self.offset = 0
+        self.size = file_stat.st_size
+
+        if self.offset == self.size:
+            return
+
+        lines = 0
+        self._parse_failures = self._unknown_rules = 0
+        with open(file_path, 'rb') as input_file:
+            input_file.seek(self.offset)
+
+            for line in input_file:
+                if not line.endswith(b'\n'):
+                    break
+
+                self.offset += len(line)
+                lines += 1
+                if self.skip_lines:
+                    self.skip_lines -= 1
+                    continue
+
+                event = self.parse_alert(line)
+                if event is not None:
+                    self.add_to_batch(event)
+
+                if lines % BATCH_SIZE == 0:
+                    self.count_read(lines)
+                    lines = 0
+        self.count_read(lines)
 
-        new_content = all_lines[self.lines_count:]
-        self.lines_count = len(all_lines)
+    def source_status(self) -> dict:
+        try:
+            file_size = os.stat(self.file_path).st_size
+        except FileNotFoundError:
+            file_size = 0
 
-        for line in new_content:
+        return {
+            'file_path': self.file_path,
+            'file_size': file_size,
+            'offset': self.offset,
+            'bytes_behind': max(file_size - self.offset, 0),
+        }
+
+
+class SocketReader(AlertPipeline):
+    """
+    Receives alerts pushed to a Unix socket by Snort or a forwarder as alert_json records and writes them to
+    the database, without the file writes and watchdog delays of tailing alert_json.txt.
+
+    A stream socket accepts any number of connections, each record ends with a newline. Every datagram of
+    a datagram socket holds one or more records, the last one may omit the newline. The batch is queued as soon as
+    no more data is waiting, so alerts reach the database within milliseconds while the database keeps up.
+    Unlike the file, the socket cannot be reread: there is no position to checkpoint and records sent while
+    alert_reader is stopped are lost.
+
+    Attributes:
+    - socket_path (str): path of the Unix socket
+    - socket_type (str): "stream" or "datagram"
+    - server (socket.socket): the bound socket
+    - selector (selectors.BaseSelector): waits for data on the socket and stream connections
+    - buffers (dict): incomplete record received so far, by stream connection
+    """
+    def __init__(self, socket_path, socket_type='stream'):
+        self.socket_path = socket_path
+        self.socket_type = socket_type
+        self.server = None
+        self.selector = selectors.DefaultSelector()
+        self.buffers = {}
+        super().__init__()
+
+    def start(self):
+        """Binds the socket, replacing a stale socket file, and starts reader and writer threads"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        kind = socket.SOCK_STREAM if self.socket_type == 'stream' else socket.SOCK_DGRAM
+        self.server = socket.socket(socket.AF_UNIX, kind)
+        self.server.bind(self.socket_path)
+        if self.socket_type == 'stream':
+            self.server.listen()
+        self.server.setblocking(False)
+        self.selector.register(self.server, selectors.EVENT_READ)
+        alert_reader_logger.info(f'Listening on {self.socket_type} socket {self.socket_path}')
+        super().start()
+
+    def read_alerts(self):
+        """Reader thread: receives records until stopped, queues the batch whenever no more data is waiting"""
+        while not self._stopping.is_set():
             try:
-                alert_data = json.loads(line)
+                ready = self.selector.select(0 if self.batch else BATCH_TIMEOUT)
+                for key, _ in ready:
+                    self.receive(key.fileobj)
+                if not ready:
+                    self.flush()
+                self.flush_if_due()
+            except Exception as e:
+                alert_reader_logger.exception(f'Error receiving alerts: {e}')
+                time.sleep(BATCH_TIMEOUT)
+
+        self.flush()
+        self.close()
+        connection.close()
+
+    def receive(self, sock):
+        """Accepts a stream connection or receives data from a connection or the datagram socket"""
+        if self.socket_type == 'datagram':
+            self.process_records(sock.recv(MAX_RECORD_SIZE).split(b'\n'))
+            return
+
+        if sock is self.server:
+            client, _ = self.server.accept()
+            client.setblocking(False)
+            self.selector.register(client, selectors.EVENT_READ)
+            self.buffers[client] = b''
+            return
+
+        data = sock.recv(MAX_RECORD_SIZE)
+        if not data:
+            if self.buffers.pop(sock):
+                alert_reader_logger.warning('Connection closed in the middle of a record, the record is dropped')
+            self.selector.unregister(sock)
+            sock.close()
+            return
+
+        records = (self.buffers[sock] + data).split(b'\n')
+        self.buffers[sock] = records.pop()
+        self.process_records(records)
+
+    def process_records(self, records):
+        """Parses complete records and adds them to the batch"""
+        lines = 0
+        for record in records:
+            if not record.strip():
+                continue
+
+            lines += 1
+            event = self.parse_alert(record)
+            if event is not None:
+                self.add_to_batch(event)
+        self.count_read(lines)
+
+    def close(self):
+        """Closes the socket with all connections and removes the socket file"""
+        for key in list(self.selector.get_map().values()):
+            self.selector.unregister(key.fileobj)
+            key.fileobj.close()
+        self.buffers = {}
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
 
-                rule = Rule.objects.get(sid=alert_data["sid"], rev=alert_data["rev"], gid=alert_data["gid"])
-                timestamp = make_aware(datetime.strptime(alert_data['timestamp'], '%y/%m/%d-%H:%M:%S.%f'))
+    def source_status(self) -> dict:
+        return {
+            'socket_path': self.socket_path,
+            'socket_type': self.socket_type,
+            'connections': len(self.buffers),
+        }
 
-                Event.objects.create(rule_id=rule, timestamp=timestamp, src_addr=alert_data['src_addr'],
-                                     src_port=alert_data.get('src_port'), dst_addr=alert_data['dst_addr'],
-                                     dst_port=alert_data.get('dst_port'), proto=alert_data['proto'])
 
-            except (json.JSONDecodeError, ValueError, ValidationError) as e:
-                alert_reader_logger.error(f"Error processing alert: {line}")
-                alert_reader_logger.error(f"Error details: {e}")
-        alert_reader_logger.info('DB updated')
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Write Snort alerts to the database')
+    parser.add_argument('path', nargs='?', default='../snort_logs/', help='directory of alert_json.txt to tail')
+    parser.add_argument('--socket', help='receive alert_json records on this Unix socket instead of tailing the file')
+    parser.add_argument('--socket-type', choices=['stream', 'datagram'], default='stream',
+                        help='type of the Unix socket')
+    parser.add_argument('--aggregation-window', type=float, default=AGGREGATION_WINDOW,
+                        help='seconds during which identical alerts are folded into one event, 0 to turn it off')
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    path = sys.argv[1] if len(sys.argv) > 1 else '../snort_logs/'
-    event_handler = Handler()
-    observer = Observer()
-    observer.schedule(event_handler, path, recursive=False)
-    observer.start()
+    args = parse_args()
+    AGGREGATION_WINDOW = args.aggregation_window
+    observer = None
+    if args.socket:
+        event_handler = SocketReader(args.socket, args.socket_type)
+        event_handler.start()
+    else:
+        event_handler = Handler(os.path.join(args.path, 'alert_json.txt'))
+        event_handler.start()
+        observer = Observer()
+        observer.schedule(event_handler, args.path, recursive=False)
+        observer.start()
 
     try:
         while True:
-            time.sleep(1)
+            time.sleep(STATUS_INTERVAL)
+            event_handler.publish_status()
     except KeyboardInterrupt:
         alert_reader_logger.info('KeyboardInterrupt')
-        observer.stop()
     finally:
-        lines_count = event_handler.lines_count
-        with open('../snort_logs/lines_count.txt', 'w') as file:
-            file.write(str(lines_count))
-    observer.join()
+        if observer is not None:
+            observer.stop()
+            observer.join()
+        event_handler.stop()
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from event.models import DataVersion
+
+API_CACHE = 'api'
+
+
+def request_digest(view_name: str, request, token) -> str:
+    """
+    Return the hash of what the response to a GET depends on: the view, the url without query, the query
+    parameters sorted by name and value, the negotiated format and a change token of the data.
+    The url keeps responses with absolute pagination links of different hosts apart.
+    """
+    params = sorted((name, sorted(request.query_params.getlist(name))) for name in request.query_params)
+    renderer = getattr(request, 'accepted_renderer', None)
+    parts = [view_name, request.build_absolute_uri(request.path), params, renderer and renderer.format, token]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+
+def entity_tag(view_name: str, request, token, weak: bool = False) -> str:
+    """Return the strong ETag of the response to a GET, see request_digest, or a weak one if weak"""
+    tag = f'"{request_digest(view_name, request, token)}"'
+    return f'W/{tag}' if weak else tag
+
+
+def not_modified(request, etag: str):
+    """
+    Return a 304 response if the If-None-Match header of the request lists etag or is *, otherwise None.
+    Tags are compared without their weak prefix, as If-None-Match uses the weak comparison.
+    """
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return None
+    tags = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    if '*' in tags or etag.removeprefix('W/') in tags:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return None
+
+
+def cached_response(*data_sets: str, time_slot: int = None):
+    """
+    Decorator of APIView.get answering conditional requests with 304 and serving repeated requests from
+    the API_CACHE cache, without running the view in both cases.
+
+    The change token of a response is the DataVersion of every data set the view reads, so an ETag and
+    a cached response are used only until the data set is bumped: by alert_reader for every committed batch,
+    by rule_reader for changed rules, by the events PATCH and by dropping an event partition.
+    The versions are read before the view reads the data, so a response cached while a change commits can only
+    be newer than its key. Only 200 responses are cached and get an ETag.
+
+    :param data_sets: names of the DataVersion counters of the data the view reads
+    :param time_slot: seconds after which a response expires even if the data did not change, for views whose
+                      results depend on the current time
+    """
+    def decorator(get):
+        @wraps(get)
+        def cached_get(view, request, *args, **kwargs):
+            view_name = type(view).__name__
+            token = [DataVersion.get_versions(data_sets)]
+            if time_slot:
+                token.append(int(time.time() // time_slot))
+            digest = request_digest(view_name, request, token)
+            etag = f'"{digest}"'
+            response = not_modified(request, etag)
+            if response is not None:
+                return response
+
+            cache = caches[API_CACHE]
+            key = f'{view_name}:{digest}'
+            data = cache.get(key)
+            if data is not None:
+                response = Response(data)
+            else:
+                response = get(view, request, *args, **kwargs)
+                if response.status_code == status.HTTP_200_OK:
+                    cache.set(key, response.data, settings.API_CACHE_TIMEOUT)
+
+            if response.status_code == status.HTTP_200_OK:
+                response['ETag'] = etag
+            return response
+        return cached_get
+    return decorator
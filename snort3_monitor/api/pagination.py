@@ -0,0 +1,84 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class EventCursorPagination(BasePagination):
+    """
+    Keyset pagination of events on (timestamp, id), oldest events first, for querysets of event_values dicts.
+
+    Every page is read with "timestamp, id greater than the last row of the previous page" instead of an OFFSET,
+    so it costs the same on page 1 and on page 10000 and rows inserted meanwhile never shift a page.
+    The position is passed as an opaque 'cursor' query parameter. The full COUNT(*) is replaced by
+    the row estimate of the PostgreSQL planner, None on other databases.
+
+    'next' is returned for every page with rows and is None for an empty page. A client paging through all
+    events follows 'next' until results are empty and can keep the last cursor to continue later.
+    """
+    cursor_query_param = 'cursor'
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    ordering = ('timestamp', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Return the page of queryset following the position in the cursor query parameter"""
+        self.request = request
+        self.estimated_count = self.estimate_count(queryset)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            timestamp, event_id = self.decode_cursor(cursor)
+            queryset = queryset.filter(timestamp__gte=timestamp).exclude(timestamp=timestamp, id__lte=event_id)
+
+        self.page = list(queryset.order_by(*self.ordering)[:self.page_size])
+        return self.page
+
+    def get_paginated_response(self, data):
+        """Return the page with the link to the next one and the estimated number of events"""
+        return Response({
+            'next': self.get_next_link(),
+            'estimated_count': self.estimated_count,
+            'results': data,
+        })
+
+    def get_next_link(self):
+        """Return the url of the page following the last event of this page, None if the page is empty"""
+        if not self.page:
+            return None
+        last = self.page[-1]
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(last['timestamp'], last['id']))
+
+    @staticmethod
+    def encode_cursor(timestamp: datetime, event_id: int) -> str:
+        """Return the opaque cursor of the position after the event"""
+        position = json.dumps([timestamp.isoformat(), event_id])
+        return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple[datetime, int]:
+        """Return timestamp and id of the cursor or raise ValidationError if the cursor is malformed"""
+        try:
+            position = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            timestamp, event_id = json.loads(position)
+            timestamp = datetime.fromisoformat(timestamp)
+            if timestamp.tzinfo is None or not isinstance(event_id, int):
+                raise ValueError
+        except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+            raise ValidationError('Invalid cursor')
+        return timestamp, event_id
+
+    @staticmethod
+    def estimate_count(queryset) -> int:
+        """Return the number of rows of queryset estimated by the PostgreSQL planner, None on other databases"""
+        if connection.vendor != 'postgresql':
+            return None
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
@@ -0,0 +1,149 @@
+import logging
+import subprocess
+import threading
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
+
+from event.models import RuleUpdateJob
+from rule_reader import SNORT_DUMP_COMMAND, SnortDumpError, stream_rules
+
+
+PULLEDPORK_COMMAND = ['/usr/local/bin/pulledpork/pulledpork.py', '-c', 'configs/pulledpork.conf', '-v']
+PULLEDPORK_SUCCESS = 'Program execution complete'
+HEARTBEAT_INTERVAL = 2
+STALE_AFTER = timedelta(minutes=1)
+OUTPUT_LIMIT = 100000
+
+rule_update_logger = logging.getLogger(__name__)
+
+
+class RuleUpdateRunning(Exception):
+    """Raised when a rule update is requested while another one is running"""
+    def __init__(self, job_id: int):
+        super().__init__(f'Rule update job {job_id} is already running')
+        self.job_id = job_id
+
+
+def fail_stale_jobs():
+    """
+    Marks active jobs as failed whose runner sent no heartbeat for STALE_AFTER (e.g. after a worker restart).
+    A job that never got a heartbeat, because its worker died before the runner started, counts from its creation.
+    """
+    (RuleUpdateJob.objects.alias(last_seen_at=Coalesce('heartbeat_at', 'created_at'))
+     .filter(active=True, last_seen_at__lt=now() - STALE_AFTER)
+     .update(active=False, status=RuleUpdateJob.FAILED, error='The job stopped responding', finished_at=now()))
+
+
+def start_rule_update() -> RuleUpdateJob:
+    """
+    Creates a rule update job and runs it in background threads of this process, stale jobs are failed first.
+
+    :return: the created job
+    :raise RuleUpdateRunning: if another job is active
+    """
+    fail_stale_jobs()
+    try:
+        with transaction.atomic():
+            job = RuleUpdateJob.objects.create()
+    except IntegrityError:
+        active_job = RuleUpdateJob.objects.filter(active=True).values_list('id', flat=True).first()
+        raise RuleUpdateRunning(active_job)
+
+    RuleUpdateRunner(job).start()
+    return job
+
+
+class RuleUpdateRunner:
+    """
+    Runs pulledpork and then rule_reader for one RuleUpdateJob.
+
+    The job thread keeps the progress in memory. rule_reader writes rules in one long transaction, so the progress
+    is written to the job row by a separate heartbeat thread with its own database connection, which makes it
+    visible to other API workers while the transaction is open.
+
+    Attributes:
+    - job (RuleUpdateJob): the job being run
+    - phase (str): current step of the job
+    - output (list): lines printed by pulledpork
+    - rules_processed (int): rule lines read by rule_reader
+    """
+    def __init__(self, job: RuleUpdateJob):
+        self.job = job
+        self.phase = ''
+        self.output = []
+        self.rules_processed = 0
+        self._finished = threading.Event()
+        self._heartbeat = threading.Thread(target=self.send_heartbeats, name=f'rule-update-{job.id}-heartbeat',
+                                           daemon=True)
+        self._thread = threading.Thread(target=self.run, name=f'rule-update-{job.id}', daemon=True)
+
+    def start(self):
+        """Starts the job and heartbeat threads"""
+        started_at = now()
+        RuleUpdateJob.objects.filter(id=self.job.id).update(status=RuleUpdateJob.RUNNING, started_at=started_at,
+                                                            heartbeat_at=started_at)
+        self._heartbeat.start()
+        self._thread.start()
+
+    def run(self):
+        """Job thread: runs both steps and saves the result"""
+        result = {'status': RuleUpdateJob.FAILED}
+        try:
+            result = self.run_steps()
+        except Exception as e:
+            rule_update_logger.exception(f'Rule update job {self.job.id} failed: {e}')
+            result['error'] = str(e)
+        finally:
+            self._finished.set()
+            self._heartbeat.join()
+            self.phase = 'done'
+            RuleUpdateJob.objects.filter(id=self.job.id).update(
+                **self.progress(), **result, active=False, finished_at=now())
+            connection.close()
+
+    def run_steps(self) -> dict:
+        """Runs pulledpork and, if it succeeded, rule_reader; returns the final fields of the job"""
+        self.phase = 'pulledpork'
+        process = subprocess.Popen(PULLEDPORK_COMMAND, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   encoding='utf-8', errors='replace')
+        with process.stdout:
+            for line in process.stdout:
+                self.output.append(line)
+        returncode = process.wait()
+
+        if PULLEDPORK_SUCCESS not in ''.join(self.output):
+            return {'status': RuleUpdateJob.FAILED, 'error': f'pulledpork failed with exit status {returncode}'}
+
+        self.phase = 'rule_reader'
+        try:
+            with transaction.atomic():
+                counts = stream_rules(SNORT_DUMP_COMMAND, self.count_rules)
+        except (OSError, SnortDumpError) as e:
+            return {'status': RuleUpdateJob.FAILED, 'error': f'Error while dumping Snort rules: {e}'}
+        return {'status': RuleUpdateJob.SUCCEEDED, 'counts': counts}
+
+    def count_rules(self, processed: int):
+        """Progress callback of rule_reader"""
+        self.rules_processed = processed
+
+    def progress(self) -> dict:
+        """Returns the progress fields of the job"""
+        return {
+            'phase': self.phase,
+            'rules_processed': self.rules_processed,
+            'output': ''.join(self.output)[-OUTPUT_LIMIT:],
+            'heartbeat_at': now(),
+        }
+
+    def send_heartbeats(self):
+        """Heartbeat thread: writes the progress every HEARTBEAT_INTERVAL seconds until the job is finished"""
+        while not self._finished.wait(HEARTBEAT_INTERVAL):
+            try:
+                RuleUpdateJob.objects.filter(id=self.job.id).update(**self.progress())
+            except Exception as e:
+                rule_update_logger.exception(f'Error saving progress of rule update job {self.job.id}: {e}')
+                connection.close()
+        connection.close()
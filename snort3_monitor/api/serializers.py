@@ -1,6 +1,7 @@
+from django.db.models import F
 from rest_framework import serializers
 
-from event.models import Event, Rule
+from event.models import Event, Rule, RuleUpdateJob
 from request.models import RequestLog
 
 
@@ -14,10 +15,46 @@ class EventSerializer(serializers.ModelSerializer):
     sid = serializers.IntegerField(source='rule_id.sid')
     action = serializers.CharField(source='rule_id.action')
     msg = serializers.CharField(source='rule_id.msg')
+    first_seen = serializers.DateTimeField(source='timestamp')
 
     class Meta:
         model = Event
-        fields = ['id', 'sid', 'timestamp', 'src_addr', 'src_port', 'dst_addr', 'dst_port', 'proto', 'action', 'msg']
+        fields = ['id', 'sid', 'timestamp', 'src_addr', 'src_port', 'dst_addr', 'dst_port', 'proto', 'action', 'msg',
+                  'count', 'first_seen', 'last_seen']
+
+
+def event_values(queryset):
+    """Return queryset of dicts with the columns EventSerializer reads, joined with the rule in the same query"""
+    return queryset.values('id', 'timestamp', 'src_addr', 'src_port', 'dst_addr', 'dst_port', 'proto', 'count',
+                           'last_seen', sid=F('rule_id__sid'), action=F('rule_id__action'), msg=F('rule_id__msg'))
+
+
+def serialize_event_values(rows) -> list:
+    """
+    Return the same data as EventSerializer(many=True) for rows of event_values,
+    without building model instances and serializer fields for every event.
+    """
+    to_datetime = serializers.DateTimeField().to_representation
+    data = []
+    for row in rows:
+        timestamp = to_datetime(row['timestamp'])
+        last_seen = row['last_seen']
+        data.append({
+            'id': row['id'],
+            'sid': row['sid'],
+            'timestamp': timestamp,
+            'src_addr': row['src_addr'],
+            'src_port': row['src_port'],
+            'dst_addr': row['dst_addr'],
+            'dst_port': row['dst_port'],
+            'proto': row['proto'],
+            'action': row['action'],
+            'msg': row['msg'],
+            'count': row['count'],
+            'first_seen': timestamp,
+            'last_seen': to_datetime(last_seen) if last_seen is not None else None,
+        })
+    return data
 
 
 class RuleSerializer(serializers.ModelSerializer):
@@ -26,8 +63,14 @@ class RuleSerializer(serializers.ModelSerializer):
         fields = ['id', 'gid', 'sid', 'rev', 'action', 'msg']
 
 
+class RuleUpdateJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RuleUpdateJob
+        exclude = ['active']
+
+
 class SidCountSerializer(serializers.Serializer):
-    sid = serializers.IntegerField(source='rule_id__sid')
+    sid = serializers.IntegerField()
     count = serializers.IntegerField()
 
 
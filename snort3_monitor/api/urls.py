@@ -1,7 +1,7 @@
 from django.urls import path
 
-from .views import (EventsList, EventsCount, RequestList, RulesList, ExecuteCommand, UpdateRules, StartRuleProfiler,
-                    RuleProfilerLast, PerfMonitor, WriteRule)
+from .views import (EventsList, EventsCount, RequestList, RulesList, ExecuteCommand, UpdateRules, RuleUpdateStatus,
+                    StartRuleProfiler, RuleProfilerLast, PerfMonitor, WriteRule, IngestStatus, SchedulerStatus)
 
 
 urlpatterns = [
@@ -11,8 +11,11 @@ urlpatterns = [
     path('rules', RulesList.as_view(), name='rules_list'),
     path('execute', ExecuteCommand.as_view(), name='execute_command'),
     path('update-rules', UpdateRules.as_view(), name='update_rules'),
+    path('update-rules/<int:job_id>', RuleUpdateStatus.as_view(), name='rule_update_status'),
     path('rule-profiler', StartRuleProfiler.as_view(), name='rule_profiler'),
     path('rule-profiler-last', RuleProfilerLast.as_view(), name='rule_profiler_last'),
     path('perf-monitor', PerfMonitor.as_view(), name='perf_monitor'),
-    path('write-rule', WriteRule.as_view(), name='write_rule')
+    path('write-rule', WriteRule.as_view(), name='write_rule'),
+    path('ingest-status', IngestStatus.as_view(), name='ingest_status'),
+    path('scheduler-status', SchedulerStatus.as_view(), name='scheduler_status'),
 ]
@@ -1,11 +1,12 @@
 import ipaddress
-import subprocess
 import json
 import os
 import time
 from datetime import timedelta, datetime
 
-from django.db.models import Count
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
 from django.utils.timezone import make_aware, now
 
 from rest_framework.exceptions import ValidationError
@@ -14,12 +15,16 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
 
-from event.models import Rule, Event
+from event.models import Rule, Event, DataVersion, DeletionWatermark, RuleUpdateJob
+from event.rollups import clear_rollups, count_events, lock_rollups
 from request.models import RequestLog
+from .cache import cached_response, entity_tag, not_modified
 from .mongo_functions import pgc_aggr, pgc_module_aggr, pgc_module_report, pgc_report
-from .serializers import EventSerializer, SidCountSerializer, AddrCountSerializer, RequestSerializer, RuleSerializer
+from .pagination import EventCursorPagination
+from .rule_update_jobs import RuleUpdateRunning, fail_stale_jobs, start_rule_update
+from .serializers import (SidCountSerializer, AddrCountSerializer, RequestSerializer, RuleSerializer,
+                          RuleUpdateJobSerializer, event_values, serialize_event_values)
 from .snort_telnet import execute_snort_command
-from rule_reader import rule_reader
 
 MIN_PORT, MAX_PORT = 0, 65535
 
@@ -60,13 +65,24 @@ class EventsList(APIView, PageNumberPagination):
                 if not proto.isalpha():
                     raise ValidationError(f'Invalid protocol - "{proto}"')
 
+        elif field == 'pagination' and not all(value in ['page', 'cursor'] for value in values):
+            raise ValidationError('Invalid pagination. Should be "page" or "cursor"')
+
+    @cached_response(DataVersion.EVENTS, DataVersion.RULES)
     def get(self, request):
         """
         Endpoint for providing Snort Events and filtering them based on: 'source_ip', 'dest_ip', 'source_port',
         'dest_port', 'sid', 'protocol'.
+
+        Events are read as dicts with one joined query and rendered by serialize_event_values, which gives
+        the output of EventSerializer without building model instances.
+        Pages are numbered by default. With 'pagination=cursor' or a 'cursor' parameter the events are paged
+        by EventCursorPagination on (timestamp, id) instead, which keeps deep pages fast and skips COUNT(*).
         """
-        queryset = Event.objects.filter(is_deleted=False)
-        filter_fields = ['source_ip', 'dest_ip', 'source_port', 'dest_port', 'sid', 'protocol', 'page']
+        queryset = Event.objects.live()
+        filter_fields = ['source_ip', 'dest_ip', 'source_port', 'dest_port', 'sid', 'protocol', 'page', 'pagination',
+                         'cursor']
+        pagination_fields = ['page', 'pagination', 'cursor']
         mapping = {'sid': 'rule_id__sid', 'source_ip': 'src_addr', 'dest_ip': 'dst_addr',
                    'source_port': 'src_port', 'dest_port': 'dst_port', 'protocol': 'proto'}
         filters_dict = {}
@@ -89,21 +105,43 @@ class EventsList(APIView, PageNumberPagination):
                 if field == 'protocol':
                     values = [item.upper() for item in values]
 
-                if field != 'page':
+                if field not in pagination_fields:
                     field = mapping[field]
                     filters_dict[f'{field}__in'] = values
 
         if filters_dict:
             queryset = queryset.filter(**filters_dict)
 
-        paginated_queryset = self.paginate_queryset(queryset, request, view=self)
+        query_params = self.request.query_params
+        if query_params.get('pagination') == 'cursor' or 'cursor' in query_params:
+            if 'page' in query_params:
+                return Response({'error': 'ValidationError',
+                                 'message': 'Parameter "page" can not be used with cursor pagination'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            paginator = EventCursorPagination()
+            try:
+                paginated_queryset = paginator.paginate_queryset(event_values(queryset), request, view=self)
+            except ValidationError as e:
+                return Response({'error': 'ValidationError',
+                                 'message': ''.join(e.detail)}, status=status.HTTP_400_BAD_REQUEST)
+            return paginator.get_paginated_response(serialize_event_values(paginated_queryset))
 
-        serializer = EventSerializer(paginated_queryset, many=True)
-        return self.get_paginated_response(serializer.data)
+        paginated_queryset = self.paginate_queryset(event_values(queryset), request, view=self)
+        return self.get_paginated_response(serialize_event_values(paginated_queryset))
 
     def patch(self, request):
-        """Marks all events as deleted"""
-        Event.objects.all().update(is_deleted=True)
+        """
+        Marks all events as deleted and clears their rollups in one transaction.
+        Only the deletion watermark is moved to the highest event id, so no event row is written and
+        the request takes the same time for any number of events. clear_deleted_events.py removes the rows later.
+        """
+        with transaction.atomic():
+            lock_rollups()
+            last_id = Event.objects.aggregate(last_id=Max('id'))['last_id']
+            if last_id is not None:
+                DeletionWatermark.advance(DeletionWatermark.EVENTS, last_id)
+            clear_rollups()
+            DataVersion.bump(DataVersion.EVENTS)
         return Response({"message": "All events are marked as deleted."})
 
 
@@ -130,9 +168,12 @@ class EventsCount(APIView, PageNumberPagination):
         elif field == 'type' and values not in type_values:
             raise ValidationError('Invalid type selected. Should be "sid" or "addr"')
 
+    @cached_response(DataVersion.EVENTS, time_slot=settings.API_CACHE_COUNT_SLOT)
     def get(self, request):
         """
         Endpoint for counting events based on specified period and type.
+        Counts are read from the hourly rollups, see event.rollups.count_events. As periods end at the current
+        time, cached counts are also renewed every API_CACHE_COUNT_SLOT seconds.
         """
         period_filters = {
             'all': timedelta(weeks=0),
@@ -156,17 +197,13 @@ class EventsCount(APIView, PageNumberPagination):
             return Response({'error': 'ValidationError',
                              'message': ''.join(e.detail)}, status=status.HTTP_400_BAD_REQUEST)
 
-        queryset = Event.objects.filter(is_deleted=False)
-
         period_filter = period_filters.get(period)
-        if period_filter:
-            queryset = queryset.filter(timestamp__gte=now() - period_filter)
+        since = now() - period_filter if period_filter else None
+        count = count_events(req_type, since)
 
         if req_type == 'sid':
-            count = queryset.values('rule_id__sid').annotate(count=Count('rule_id__sid')).order_by('-count')
             serializer = SidCountSerializer(count, many=True)
         elif req_type == 'addr':
-            count = queryset.values('src_addr', 'dst_addr').annotate(count=Count('src_addr')).order_by('-count')
             serializer = AddrCountSerializer(count, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -183,6 +220,7 @@ class RulesList(APIView, PageNumberPagination):
         elif field == 'gid' and not all(gid.isnumeric() for gid in values):
             raise ValidationError('Invalid gid')
 
+    @cached_response(DataVersion.RULES)
     def get(self, request):
         """
         Endpoint for providing list of Snort Rules and filtering them based on: 'gid', 'sid', 'action'.
@@ -251,6 +289,12 @@ class RequestList(APIView, PageNumberPagination):
 
     def get(self, request):
         """
+        Request logs are only ever added, so the highest id within the period changes whenever its logs change.
+        It is the change token of the ETag, a request with a matching If-None-Match gets 304 without reading
+        the page. Logs of this endpoint are left out of the token, as RequestLogMiddleware logs every poll of it
+        and a period including the current time would otherwise get a new ETag on every request. The listing
+        still holds them, so the ETag is weak.
+
         :return: list of filtered RequestLogs or HTTP 400 BAD REQUEST with corresponding message
         """
         try:
@@ -261,9 +305,17 @@ class RequestList(APIView, PageNumberPagination):
             queryset = (RequestLog.objects.filter(timestamp__gte=period_start)
                         .filter(timestamp__lte=period_end).order_by('id'))
 
+            token = queryset.exclude(endpoint=request.path_info).aggregate(last_id=Max('id'))['last_id']
+            etag = entity_tag(type(self).__name__, request, token, weak=True)
+            response = not_modified(request, etag)
+            if response is not None:
+                return response
+
             paginate_queryset = self.paginate_queryset(queryset, request, view=self)
             serializer_class = RequestSerializer(instance=paginate_queryset, many=True)
-            return self.get_paginated_response(serializer_class.data)
+            response = self.get_paginated_response(serializer_class.data)
+            response['ETag'] = etag
+            return response
 
         except (ValueError, TypeError, KeyError):
             content = {
@@ -304,21 +356,41 @@ class UpdateRules(APIView):
     """
     API endpoint for updating intrusion detection system rules using pulledpork.
 
-    This view performs an update operation by executing pulledpork with the specified configuration file.
-    If the update is successful, it triggers a rule_reader function to write newly added rules to db.
-    Returns an output of the pulledpork update execution.
+    POST starts a background job that executes pulledpork with the specified configuration file and, if the update
+    is successful, runs rule_reader to write new and changed rules to db. It returns the job id at once, or
+    HTTP 409 CONFLICT with the id of the running job, as only one update may run at a time.
+    GET returns the status of the latest job, a job whose runner stopped responding is reported as failed.
     """
-    def get(self, request):
-        command = '/usr/local/bin/pulledpork/pulledpork.py -c configs/pulledpork.conf -v'
+    def post(self, request):
+        try:
+            job = start_rule_update()
+        except RuleUpdateRunning as e:
+            return Response({'error': 'Conflict', 'message': str(e), 'job_id': e.job_id},
+                            status=status.HTTP_409_CONFLICT)
+        return Response({'job_id': job.id, 'status': job.status}, status=status.HTTP_202_ACCEPTED)
 
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
+    def get(self, request):
+        fail_stale_jobs()
+        job = RuleUpdateJob.objects.order_by('-id').first()
+        if job is None:
+            return Response({'result': 'No rule updates yet'})
+        return Response(RuleUpdateJobSerializer(job).data)
 
-        response = result.stdout
 
-        if 'Program execution complete' in response:
-            rule_reader()
+class RuleUpdateStatus(APIView):
+    """
+    API endpoint for polling a rule update job.
 
-        return Response({'response': response})
+    Returns status, phase, number of processed rules, pulledpork output and rule counts of the job.
+    A job whose runner stopped responding is reported as failed.
+    """
+    def get(self, request, job_id):
+        fail_stale_jobs()
+        job = RuleUpdateJob.objects.filter(id=job_id).first()
+        if job is None:
+            return Response({'error': 'Not Found', 'message': f'Rule update job {job_id} does not exist'},
+                            status=status.HTTP_404_NOT_FOUND)
+        return Response(RuleUpdateJobSerializer(job).data)
 
 
 class StartRuleProfiler(APIView):
@@ -510,3 +582,54 @@ class WriteRule(APIView):
             return Response({'success': True, 'message': 'String written to file successfully'})
         except Exception as e:
             return Response({'success': False, 'message': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class StatusFileView(APIView):
+    """
+    Base of the endpoints returning the status json-file a background process publishes regularly,
+    together with the number of seconds since it was published.
+
+    Attributes:
+    - status_file_setting (str): name of the setting with the path of the status file
+    - status_name (str): name of the status in messages
+    """
+    status_file_setting = None
+    status_name = None
+
+    def get(self, request):
+        path = getattr(settings, self.status_file_setting)
+        if not os.path.exists(path):
+            return Response({"result": f"No {self.status_name} status yet"})
+
+        try:
+            with open(path, 'r') as file:
+                published_status = json.load(file)
+        except json.JSONDecodeError:
+            return Response({"error": f"Invalid JSON format in the {self.status_name} status file"},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        published_at = datetime.fromisoformat(published_status['published_at'])
+        published_status['seconds_since_published'] = round((now() - published_at).total_seconds(), 1)
+        return Response({"result": published_status})
+
+
+class IngestStatus(StatusFileView):
+    """
+    API Endpoint for Retrieving the Status of alert_reader.
+
+    Returns the counters, histograms and reading position last published by alert_reader, together with
+    the number of seconds since they were published.
+    """
+    status_file_setting = 'INGEST_STATUS_FILE'
+    status_name = 'ingest'
+
+
+class SchedulerStatus(StatusFileView):
+    """
+    API Endpoint for Retrieving the Status of scheduler.py.
+
+    Returns the interval, run counts and timing stats of every periodic job last published by the scheduler,
+    together with the number of seconds since they were published.
+    """
+    status_file_setting = 'SCHEDULER_STATUS_FILE'
+    status_name = 'scheduler'
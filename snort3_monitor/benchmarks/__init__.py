@@ -0,0 +1,4 @@
+"""
+Benchmarks of the project, run from the snort3_monitor directory, e.g.:
+    python -m benchmarks.ingest --help
+"""
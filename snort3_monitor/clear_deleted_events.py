@@ -1,32 +1,171 @@
-"""Script for clearing events marked as deleted (is_deleted=True)"""
+"""
+Script for clearing deleted events: events at or below the deletion watermark and events marked as deleted
+(is_deleted=True).
 
+Events are deleted with raw DELETE statements over ranges of at most PURGE_CHUNK_SIZE ids, each in its own
+transaction, so no rows are loaded into Python and ingestion is never blocked for long. A run stops after
+PURGE_TIME_BUDGET seconds and the next run continues where it stopped. Runs hold an flock on PURGE_LOCK_FILE,
+so a run started by hand while scheduler.py is purging, or the other way round, exits at once.
+"""
+
+import argparse
+import fcntl
 import logging
 import os
+import time
 
 import django
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "snort3_monitor.settings")
 django.setup()
 
-from event.models import Event
+from django.conf import settings
+from django.db import connection
+
+from event.models import DeletionWatermark, Event
 
-cron_logger = logging.getLogger("__name__")
+cron_logger = logging.getLogger(__name__)
 cron_logger.setLevel(logging.INFO)
 
-# f_handler = logging.FileHandler('../log_files/cron.log')
-#  relative path does not work because the program runs from the cron location
-f_handler = logging.FileHandler('/usr/src/event-monitor-snort3/log_files/cron.log')
+f_handler = logging.FileHandler(settings.BASE_DIR.parent / 'log_files' / 'cron.log')
 f_handler.setLevel(logging.INFO)
 f_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 f_handler.setFormatter(f_format)
 
 cron_logger.addHandler(f_handler)
 
+PURGE_CHUNK_SIZE = 10000
+PURGE_TIME_BUDGET = 50
+PURGE_CHUNK_PAUSE = 0.1
+PROGRESS_INTERVAL = 10
+PURGE_LOCK_FILE = settings.BASE_DIR.parent / 'log_files' / 'clear_deleted_events.lock'
+
+
+class Purge:
+    """
+    Deletes deleted events chunk by chunk until all are gone or the time budget is used up.
+
+    Attributes:
+    - chunk_size (int): maximum number of events deleted by one statement
+    - pause (float): seconds to sleep after every chunk, leaving the database to other writers
+    - deadline (float): monotonic time after which no new chunk is started
+    - deleted (int): events deleted by this run
+    - chunks (int): DELETE statements executed by this run
+    - started (float): monotonic time the run started
+    - last_report (float): monotonic time progress was last logged
+    - table (str): quoted name of the events table
+    """
+    def __init__(self, chunk_size: int, time_budget: float, pause: float):
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.started = self.last_report = time.monotonic()
+        self.deadline = self.started + time_budget
+        self.deleted = 0
+        self.chunks = 0
+        self.table = connection.ops.quote_name(Event._meta.db_table)
+
+    def in_budget(self) -> bool:
+        """Return True if another chunk may be started"""
+        return time.monotonic() < self.deadline
+
+    def delete_range(self, first_id: int, last_id: int, marked_only: bool = False) -> int:
+        """Delete the events with ids from first_id to last_id, only those marked as deleted if marked_only"""
+        sql = f'DELETE FROM {self.table} WHERE id >= %s AND id <= %s'
+        params = [first_id, last_id]
+        if marked_only:
+            sql += ' AND is_deleted = %s'
+            params.append(True)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.rowcount
+
+        self.deleted += rows
+        self.chunks += 1
+        if time.monotonic() - self.last_report >= PROGRESS_INTERVAL:
+            self.last_report = time.monotonic()
+            cron_logger.info(f'Deleted {self.deleted} events in {self.chunks} chunks so far, up to id {last_id}')
+        time.sleep(self.pause)
+        return rows
+
+    def purge_below_watermark(self) -> bool:
+        """
+        Delete the events at or below the deletion watermark in ranges of chunk_size ids, oldest first.
+        Returns True if none are left.
+        """
+        watermark = DeletionWatermark.get_last_id(DeletionWatermark.EVENTS)
+        pending = Event.objects.filter(id__lte=watermark).order_by('id').values_list('id', flat=True)
+        last_deleted = 0
+        while self.in_budget():
+            ids = pending.filter(id__gt=last_deleted)
+            first_id = ids.first()
+            if first_id is None:
+                return True
+            last_deleted = next(iter(ids[self.chunk_size - 1:self.chunk_size]), watermark)
+            self.delete_range(first_id, last_deleted)
+        return False
+
+    def purge_marked(self) -> bool:
+        """
+        Delete the events marked as deleted in ranges covering chunk_size of them, oldest first.
+        Returns True if none are left.
+        """
+        pending = Event.objects.filter(is_deleted=True).order_by('id').values_list('id', flat=True)
+        while self.in_budget():
+            ids = list(pending[:self.chunk_size])
+            if not ids:
+                return True
+            self.delete_range(ids[0], ids[-1], marked_only=True)
+        return False
+
+    def run(self) -> bool:
+        """Delete deleted events within the time budget, return True if none are left"""
+        return self.purge_below_watermark() and self.purge_marked()
+
+
+def acquire_lock(path):
+    """Return the lock file locked with flock, None if another run holds the lock"""
+    lock_file = open(path, 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def purge_deleted_events(chunk_size: int = PURGE_CHUNK_SIZE, time_budget: float = PURGE_TIME_BUDGET,
+                         pause: float = PURGE_CHUNK_PAUSE):
+    """Delete deleted events within the time budget and log the result, skip if another run holds the lock"""
+    lock = acquire_lock(PURGE_LOCK_FILE)
+    if lock is None:
+        cron_logger.info('The previous run is still deleting events, skipping')
+        return
+
+    with lock:
+        cron_logger.info('The script has been started')
+        purge = Purge(chunk_size, time_budget, pause)
+        finished = purge.run()
+        seconds = round(time.monotonic() - purge.started, 1)
+        if finished:
+            cron_logger.info(f'Deleted {purge.deleted} events in {purge.chunks} chunks in {seconds}s')
+        else:
+            cron_logger.info(f'Deleted {purge.deleted} events in {purge.chunks} chunks in {seconds}s, '
+                             f'time budget used up, the next run continues')
+
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Delete events removed by users in bounded chunks')
+    parser.add_argument('--chunk-size', type=int, default=PURGE_CHUNK_SIZE, help='events deleted per statement')
+    parser.add_argument('--time-budget', type=float, default=PURGE_TIME_BUDGET,
+                        help='seconds after which no new chunk is started')
+    parser.add_argument('--pause', type=float, default=PURGE_CHUNK_PAUSE, help='seconds to sleep after every chunk')
+    return parser.parse_args()
+
 
 if __name__ == '__main__':
-    cron_logger.info('The script has been started')
+    args = parse_args()
     try:
-        amount_deleted_events = Event.objects.filter(is_deleted=True).delete()
-        cron_logger.info(f'Deleted {amount_deleted_events[0]} events')
+        purge_deleted_events(args.chunk_size, args.time_budget, args.pause)
     except Exception as e:
         cron_logger.error(f'An error occurred during script operation {e}')
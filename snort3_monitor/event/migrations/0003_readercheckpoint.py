@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event', '0002_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReaderCheckpoint',
+            fields=[
+                ('source', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('inode', models.BigIntegerField(null=True)),
+                ('offset', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event', '0003_readercheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event', '0004_event_count_last_seen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rule',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event', '0005_rule_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RuleUpdateJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'),
+                                                     ('succeeded', 'Succeeded'), ('failed', 'Failed')],
+                                            default='queued', max_length=10)),
+                ('phase', models.CharField(blank=True, default='', max_length=20)),
+                ('rules_processed', models.IntegerField(default=0)),
+                ('output', models.TextField(blank=True, default='')),
+                ('counts', models.JSONField(default=dict)),
+                ('error', models.TextField(blank=True, default='')),
+                ('active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ruleupdatejob',
+            constraint=models.UniqueConstraint(condition=models.Q(('active', True)), fields=('active',),
+                                               name='single_active_rule_update_job'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event', '0006_ruleupdatejob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['timestamp', 'id'],
+                               name='event_live_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['rule_id', 'timestamp'],
+                               name='event_live_rule_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['src_addr', 'dst_addr'],
+                               name='event_live_addr_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['dst_addr'],
+                               name='event_live_dst_addr_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['dst_port'],
+                               name='event_live_dst_port_idx'),
+        ),
+    ]
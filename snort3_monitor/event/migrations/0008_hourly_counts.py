@@ -0,0 +1,67 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:18
+
+from django.db import migrations, models
+
+
+HOUR_BUCKETS = {
+    'postgresql': "date_trunc('hour', e.timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'",
+    'sqlite': "strftime('%Y-%m-%d %H:00:00', e.timestamp)",
+}
+
+
+def fill_hourly_counts(apps, schema_editor):
+    """Fill the hourly counts from the events that are not deleted, grouped by the database"""
+    bucket = HOUR_BUCKETS[schema_editor.connection.vendor]
+    schema_editor.execute(f"""
+        INSERT INTO event_sidhourlycount (bucket, sid, count)
+        SELECT {bucket}, r.sid, SUM(e.count)
+        FROM event_event e JOIN event_rule r ON r.id = e.rule_id_id
+        WHERE NOT e.is_deleted
+        GROUP BY 1, 2
+    """)
+    schema_editor.execute(f"""
+        INSERT INTO event_addrhourlycount (bucket, src_addr, dst_addr, count)
+        SELECT {bucket}, COALESCE(e.src_addr, ''), COALESCE(e.dst_addr, ''), SUM(e.count)
+        FROM event_event e
+        WHERE NOT e.is_deleted
+        GROUP BY 1, 2, 3
+    """)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event', '0007_event_live_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AddrHourlyCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('src_addr', models.CharField(max_length=30)),
+                ('dst_addr', models.CharField(max_length=30)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SidHourlyCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('sid', models.IntegerField()),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='sidhourlycount',
+            constraint=models.UniqueConstraint(fields=('bucket', 'sid'), name='sid_hourly_count_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='addrhourlycount',
+            constraint=models.UniqueConstraint(fields=('bucket', 'src_addr', 'dst_addr'),
+                                               name='addr_hourly_count_key'),
+        ),
+        migrations.RunPython(fill_hourly_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event', '0008_hourly_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionWatermark',
+            fields=[
+                ('name', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event', '0009_deletion_watermark'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['id'], name='event_deleted_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils.timezone import now
 
 
 class Rule(models.Model):
@@ -13,6 +14,7 @@ class Rule(models.Model):
     - action (str): Rule actions tell Snort how to handle matching packets (e.g., "alert" or "drop").
     - msg (str): The message associated with the rule, providing additional information about the rule.
     - json (json): Whole rule entry saved in json format.
+    - content_hash (str): Hash of the rule entry, used by rule_reader to detect changed rules.
     """
     id = models.CharField(max_length=20, primary_key=True)
     gid = models.IntegerField()
@@ -21,25 +23,36 @@ class Rule(models.Model):
     action = models.CharField(max_length=10)
     msg = models.TextField()
     json = models.JSONField()
+    content_hash = models.CharField(max_length=32, blank=True, default='')
 
     def save(self, *args, **kwargs):
         self.id = f"{self.gid}/{self.sid}/{self.rev}"
         super().save(*args, **kwargs)
 
 
+class EventQuerySet(models.QuerySet):
+    """QuerySet of events with a filter for live events"""
+    def live(self):
+        """Return events that are neither marked as deleted nor at or below the deletion watermark"""
+        return self.filter(is_deleted=False, id__gt=DeletionWatermark.get_last_id(DeletionWatermark.EVENTS))
+
+
 class Event(models.Model):
     """
     Model representing a Snort Intrusion Detection / Prevention System log event.
 
     Attributes:
     - rule_id (str): Rule ForeignKey representing associated rule.
-    - timestamp (datetime): The date and time when the event occurred.
+    - timestamp (datetime): The date and time when the event occurred, the first alert if alerts were folded.
     - src_addr (str): The source IP address from which the event originated.
     - src_port (int, optional): The source port number if applicable, otherwise None.
     - dst_addr (str): The destination IP address to which the event is directed.
     - dst_port (int, optional): The destination port number if applicable, otherwise None.
     - proto (str): The network protocol used for the communication (e.g., TCP, UDP).
     - is_deleted (bool): States whether an entry was deleted by user and would be returned on requests.
+      Events deleted all at once are not marked, they are hidden by DeletionWatermark, see live().
+    - count (int): Number of identical alerts folded into the event by alert_reader, 1 if aggregation is off.
+    - last_seen (datetime, optional): Time of the last folded alert, None if the event is a single alert.
     """
     rule_id = models.ForeignKey(Rule, on_delete=models.CASCADE, to_field='id')
     timestamp = models.DateTimeField()
@@ -49,3 +62,187 @@ class Event(models.Model):
     dst_port = models.IntegerField(null=True, blank=True)
     proto = models.CharField(max_length=10)
     is_deleted = models.BooleanField(default=False)
+    count = models.PositiveIntegerField(default=1)
+    last_seen = models.DateTimeField(null=True, blank=True)
+
+    objects = EventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], condition=models.Q(is_deleted=False),
+                         name='event_live_timestamp_idx'),
+            models.Index(fields=['rule_id', 'timestamp'], condition=models.Q(is_deleted=False),
+                         name='event_live_rule_idx'),
+            models.Index(fields=['src_addr', 'dst_addr'], condition=models.Q(is_deleted=False),
+                         name='event_live_addr_idx'),
+            models.Index(fields=['dst_addr'], condition=models.Q(is_deleted=False), name='event_live_dst_addr_idx'),
+            models.Index(fields=['dst_port'], condition=models.Q(is_deleted=False), name='event_live_dst_port_idx'),
+            models.Index(fields=['id'], condition=models.Q(is_deleted=True), name='event_deleted_idx'),
+        ]
+
+
+class DeletionWatermark(models.Model):
+    """
+    Model representing the id up to which all rows of a data set, e.g. events, were deleted by the user.
+    Deleting all events moves the watermark to the highest id instead of updating every row, readers skip rows
+    at or below it and clear_deleted_events.py removes them later. Ids only grow, so new rows are never hidden.
+
+    Attributes:
+    - name (str): Name of the data set, primary key.
+    - last_id (int): Highest deleted id, 0 if nothing was deleted.
+    - updated_at (datetime): Time the watermark was last moved.
+    """
+    EVENTS = 'events'
+
+    name = models.CharField(max_length=20, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def get_last_id(cls, name: str) -> int:
+        """Return the highest deleted id of the data set, 0 if nothing was deleted"""
+        return cls.objects.filter(name=name).values_list('last_id', flat=True).first() or 0
+
+    @classmethod
+    def advance(cls, name: str, last_id: int):
+        """Move the watermark of the data set up to last_id, it is never moved back"""
+        if not cls.objects.filter(name=name, last_id__lt=last_id).update(last_id=last_id, updated_at=now()):
+            cls.objects.get_or_create(name=name, defaults={'last_id': last_id})
+
+
+class DataVersion(models.Model):
+    """
+    Model representing a version counter of a data set, e.g. rules or events.
+    The process that changes the data set bumps the counter, so long-running readers and the API response cache
+    can notice the change with one primary key lookup instead of re-reading the data.
+
+    Attributes:
+    - name (str): Name of the data set, primary key.
+    - version (int): Counter incremented on every change of the data set.
+    """
+    RULES = 'rules'
+    EVENTS = 'events'
+
+    name = models.CharField(max_length=20, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    @classmethod
+    def get_version(cls, name: str) -> int:
+        """Return current version of the data set, 0 if it was never changed"""
+        return cls.objects.filter(name=name).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def get_versions(cls, names) -> dict:
+        """Return current versions of the data sets by name with one query, 0 for data sets never changed"""
+        versions = dict(cls.objects.filter(name__in=names).values_list('name', 'version'))
+        return {name: versions.get(name, 0) for name in names}
+
+    @classmethod
+    def bump(cls, name: str):
+        """Increment version of the data set"""
+        if not cls.objects.filter(name=name).update(version=models.F('version') + 1):
+            _, created = cls.objects.get_or_create(name=name, defaults={'version': 1})
+            if not created:
+                cls.objects.filter(name=name).update(version=models.F('version') + 1)
+
+
+class ReaderCheckpoint(models.Model):
+    """
+    Model representing the position in an alert file up to which alert_reader has written events.
+    It is updated in the same transaction as the events, so after a crash reading resumes right after the last
+    committed event, without replaying or skipping alerts.
+
+    Attributes:
+    - source (str): Name of the alert source, primary key.
+    - inode (int): Inode of the alert file the offset belongs to.
+    - offset (int): Byte position right after the last line covered by committed batches.
+    - updated_at (datetime): Time of the last update.
+    """
+    source = models.CharField(max_length=50, primary_key=True)
+    inode = models.BigIntegerField(null=True)
+    offset = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class RuleUpdateJob(models.Model):
+    """
+    Model representing a background rule update: a pulledpork run followed by rule_reader.
+    The runner writes its progress to the row, so any API worker can report the status. The conditional unique
+    constraint on active lets only one job run at a time.
+
+    Attributes:
+    - status (str): queued, running, succeeded or failed.
+    - phase (str): Current step: pulledpork, rule_reader or done.
+    - rules_processed (int): Rule lines read from the Snort dump so far.
+    - output (str): Output of pulledpork, the end of it if it is very long.
+    - counts (json): Added, updated, unchanged and failed rules reported by rule_reader.
+    - error (str): Reason of the failure.
+    - active (bool): True while the job is queued or running.
+    - created_at (datetime): Time the job was requested.
+    - started_at (datetime, optional): Time the runner started.
+    - finished_at (datetime, optional): Time the job succeeded or failed.
+    - heartbeat_at (datetime, optional): Last time the runner reported progress, used to detect dead runners.
+    """
+    QUEUED, RUNNING, SUCCEEDED, FAILED = 'queued', 'running', 'succeeded', 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    phase = models.CharField(max_length=20, blank=True, default='')
+    rules_processed = models.IntegerField(default=0)
+    output = models.TextField(blank=True, default='')
+    counts = models.JSONField(default=dict)
+    error = models.TextField(blank=True, default='')
+    active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['active'], condition=models.Q(active=True),
+                                    name='single_active_rule_update_job'),
+        ]
+
+
+class SidHourlyCount(models.Model):
+    """
+    Model representing the number of live events of one sid within one hour, summed over their counts.
+    alert_reader adds every batch to it in the transaction of the batch, so EventsCount can answer from
+    the rollups instead of grouping all raw events.
+
+    Attributes:
+    - bucket (datetime): Start of the hour in UTC the event timestamps fall into.
+    - sid (int): Signature ID of the rule of the events.
+    - count (int): Sum of the counts of the live events.
+    """
+    bucket = models.DateTimeField()
+    sid = models.IntegerField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'sid'], name='sid_hourly_count_key'),
+        ]
+
+
+class AddrHourlyCount(models.Model):
+    """
+    Model representing the number of live events between one source and destination address within one hour,
+    summed over their counts. Maintained together with SidHourlyCount.
+
+    Attributes:
+    - bucket (datetime): Start of the hour in UTC the event timestamps fall into.
+    - src_addr (str): Source address of the events, empty for events without one.
+    - dst_addr (str): Destination address of the events, empty for events without one.
+    - count (int): Sum of the counts of the live events.
+    """
+    bucket = models.DateTimeField()
+    src_addr = models.CharField(max_length=30)
+    dst_addr = models.CharField(max_length=30)
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'src_addr', 'dst_addr'], name='addr_hourly_count_key'),
+        ]
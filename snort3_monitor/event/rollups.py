@@ -0,0 +1,171 @@
+"""
+Hourly rollups of live events by sid and by address pair.
+
+alert_reader adds the counts of every batch with add_counts in the transaction of the batch, the events PATCH
+clears them when it moves the deletion watermark, so the rollups always equal the grouped live rows.
+count_events combines full hours from the rollups with raw rows of the partial hour at the start of a period.
+
+Both writers call lock_rollups first, so a PATCH never interleaves with the rollup update of a batch.
+alert_reader takes the lock only in the commit turn of a batch, after its events are inserted. The events PATCH
+does not see uncommitted rows, so writer threads inserting in parallel may get ids below the watermark of
+a PATCH committed meanwhile. A batch that sees the watermark moved during its transaction rebuilds the rollups
+from the live rows instead of adding its counts.
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from django.db import connection, transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce, TruncHour
+
+from event.models import AddrHourlyCount, Event, SidHourlyCount
+
+ROLLUP_BUCKET = timedelta(hours=1)
+
+
+def bucket_start(timestamp: datetime) -> datetime:
+    """Return the start of the hour in UTC the timestamp falls into"""
+    return timestamp.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def rule_sid(rule_id: str) -> int:
+    """Return the sid from a Rule primary key of the form gid/sid/rev"""
+    return int(rule_id.split('/')[1])
+
+
+def rollup_tables() -> str:
+    """Return the quoted names of the rollup tables separated by commas"""
+    return ', '.join(connection.ops.quote_name(model._meta.db_table) for model in (SidHourlyCount, AddrHourlyCount))
+
+
+def lock_rollups():
+    """Lock the rollups against other writers until the end of the transaction, on PostgreSQL"""
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {rollup_tables()} IN SHARE ROW EXCLUSIVE MODE')
+
+
+def add_counts(increments):
+    """
+    Add counts to the rollups of the events, must be called in the transaction that writes them after lock_rollups.
+
+    :param increments: (event, count) pairs, count is added to the hour of the event timestamp
+    """
+    sid_counts, addr_counts = Counter(), Counter()
+    for event, count in increments:
+        if not count:
+            continue
+        bucket = bucket_start(event.timestamp)
+        sid_counts[bucket, rule_sid(event.rule_id_id)] += count
+        addr_counts[bucket, event.src_addr or '', event.dst_addr or ''] += count
+
+    upsert_counts(SidHourlyCount, ['bucket', 'sid'], sid_counts)
+    upsert_counts(AddrHourlyCount, ['bucket', 'src_addr', 'dst_addr'], addr_counts)
+
+
+def upsert_counts(model, key_fields: list, counts: Counter):
+    """Add counts to the rows of the model by key, inserting missing rows, in key order to avoid deadlocks"""
+    if not counts:
+        return
+
+    quote_name = connection.ops.quote_name
+    table = quote_name(model._meta.db_table)
+    keys = ', '.join(quote_name(field) for field in key_fields)
+    placeholders = ', '.join(['%s'] * (len(key_fields) + 1))
+    sql = (f'INSERT INTO {table} ({keys}, {quote_name("count")}) VALUES ({placeholders}) '
+           f'ON CONFLICT ({keys}) DO UPDATE SET {quote_name("count")} = '
+           f'{table}.{quote_name("count")} + EXCLUDED.{quote_name("count")}')
+
+    rows = [(connection.ops.adapt_datetimefield_value(key[0]), *key[1:], count)
+            for key, count in sorted(counts.items())]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def clear_rollups():
+    """
+    Delete all rollups, must be called after lock_rollups in the transaction that deletes all events.
+    On PostgreSQL the tables are truncated, which takes the same time for any number of rollups.
+    """
+    if connection.vendor != 'postgresql':
+        SidHourlyCount.objects.all().delete()
+        AddrHourlyCount.objects.all().delete()
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'TRUNCATE {rollup_tables()}')
+
+
+def rebuild_rollups(live=None, sid_model=SidHourlyCount, addr_model=AddrHourlyCount):
+    """
+    Replace the rollups with counts grouped from the live events by the database with INSERT ... SELECT.
+    The live events and the models are parameters, so migrations can pass their historical models.
+
+    :param live: queryset of the live events, Event.objects.live() if None
+    """
+    bucket = TruncHour('timestamp', tzinfo=timezone.utc)
+    if live is None:
+        live = Event.objects.live()
+    rollups = [
+        (sid_model, ['bucket', 'sid'], live.values(bucket=bucket, sid=F('rule_id__sid'))),
+        (addr_model, ['bucket', 'src_addr', 'dst_addr'],
+         live.values(bucket=bucket, src=Coalesce('src_addr', Value('')), dst=Coalesce('dst_addr', Value('')))),
+    ]
+
+    quote_name = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model, columns, groups in rollups:
+            model.objects.all().delete()
+            select, params = groups.annotate(total=Sum('count')).order_by().query.sql_with_params()
+            columns = ', '.join(quote_name(column) for column in columns + ['count'])
+            cursor.execute(f'INSERT INTO {quote_name(model._meta.db_table)} ({columns}) {select}', params)
+
+
+def count_events(group: str, since: datetime = None) -> list:
+    """
+    Return the summed counts of live events by 'sid' or 'addr' with timestamps from since on, largest first.
+
+    Hours starting at or after since are read from the rollups, events between since and the next full hour
+    from the raw rows. Both are combined and grouped by the database in one query,
+    so a batch committed meanwhile can not be counted twice or missed.
+
+    :param group: 'sid' for {'sid', 'count'} rows or 'addr' for {'src_addr', 'dst_addr', 'count'} rows
+    :param since: start of the period, None for all events
+    """
+    if group == 'sid':
+        fields = ['sid']
+        rollups = SidHourlyCount.objects.values(*fields)
+        edge = Event.objects.live().values(sid=F('rule_id__sid'))
+    else:
+        fields = ['src_addr', 'dst_addr']
+        rollups = AddrHourlyCount.objects.values(*fields)
+        edge = Event.objects.live().values(src=Coalesce('src_addr', Value('')), dst=Coalesce('dst_addr', Value('')))
+
+    parts = []
+    if since is not None:
+        full_from = bucket_start(since)
+        if full_from < since:
+            full_from += ROLLUP_BUCKET
+            parts.append(edge.filter(timestamp__gte=since, timestamp__lt=full_from))
+        rollups = rollups.filter(bucket__gte=full_from)
+    parts.insert(0, rollups)
+
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(field) for field in fields)
+    selects, params = [], []
+    for part in parts:
+        select, part_params = part.annotate(total=Sum('count')).order_by().query.sql_with_params()
+        selects.append(select)
+        params.extend(part_params)
+    sql = (f'SELECT {columns}, SUM(total) FROM ({" UNION ALL ".join(selects)}) AS counts '
+           f'GROUP BY {columns} ORDER BY SUM(total) DESC')
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    if group == 'addr':
+        return [{'src_addr': src_addr or None, 'dst_addr': dst_addr or None, 'count': int(count)}
+                for src_addr, dst_addr, count in rows]
+    return [{'sid': sid, 'count': int(count)} for sid, count in rows]
@@ -1,3 +1,383 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+from django.utils.timezone import localtime, now
+
+import alert_reader
+from api.cache import API_CACHE
+from api.rule_update_jobs import STALE_AFTER
+from event.models import DataVersion, Event, ReaderCheckpoint, Rule, RuleUpdateJob, SidHourlyCount
+from event.rollups import add_counts, bucket_start, count_events
+
+
+def make_alert_line(sid: int, src_addr: str = '10.0.0.1', timestamp: datetime = None) -> bytes:
+    """Return one alert_json line of rule 1/sid/1 at timestamp, the current local time if None"""
+    alert = {
+        'gid': 1, 'sid': sid, 'rev': 1,
+        'timestamp': (timestamp or localtime()).strftime('%y/%m/%d-%H:%M:%S.%f'),
+        'src_addr': src_addr, 'src_port': 40000, 'dst_addr': '192.168.0.1', 'dst_port': 80, 'proto': 'TCP',
+    }
+    return json.dumps(alert).encode() + b'\n'
+
+
+class AlertFileMixin:
+    """Creates a rule and a temporary alert_json.txt, writes its new lines through Handler like alert_reader does"""
+    def setUp(self):
+        Rule.objects.create(id='1/1000/1', gid=1, sid=1000, rev=1, action='alert', msg='test rule', json={})
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+        self.file_path = os.path.join(self.work_dir, 'alert_json.txt')
+
+    def append_alerts(self, count: int):
+        """Append count alert lines to alert_json.txt"""
+        with open(self.file_path, 'ab') as file:
+            file.writelines(make_alert_line(1000) for _ in range(count))
+
+    def read_and_write(self, handler: alert_reader.Handler = None) -> alert_reader.Handler:
+        """Read all new lines with handler, a new one started from the saved checkpoint if None, as one batch"""
+        handler = handler or alert_reader.Handler(self.file_path)
+        handler.process_alerts(self.file_path)
+        handler.flush()
+        handler.write_batch(handler.queue.get_nowait())
+        return handler
+
+
+class CheckpointResumeTest(AlertFileMixin, TestCase):
+    """Handler resumes after a crash from the checkpoint committed with the last batch"""
+    def test_crash_before_commit_replays_batch(self):
+        self.append_alerts(3)
+        with mock.patch.object(alert_reader.AlertPipeline, 'save_checkpoint', side_effect=RuntimeError('crash')):
+            with self.assertRaises(RuntimeError):
+                self.read_and_write()
+        self.assertEqual(Event.objects.count(), 0)
+        self.assertFalse(ReaderCheckpoint.objects.exists())
+
+        self.read_and_write()
+        self.assertEqual(Event.objects.count(), 3)
+        checkpoint = ReaderCheckpoint.objects.get(source=alert_reader.CHECKPOINT_SOURCE)
+        self.assertEqual(checkpoint.offset, os.path.getsize(self.file_path))
+        self.assertEqual(checkpoint.inode, os.stat(self.file_path).st_ino)
+
+    def test_restart_reads_only_lines_after_checkpoint(self):
+        self.append_alerts(3)
+        self.read_and_write()
+        self.append_alerts(2)
+
+        handler = self.read_and_write()
+        self.assertEqual(handler.metrics.lines_read, 2)
+        self.assertEqual(Event.objects.count(), 5)
+
+
+class AlertAggregationTest(AlertFileMixin, TestCase):
+    """Identical alerts within AGGREGATION_WINDOW are folded into one event, whose count reaches the rollups"""
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(alert_reader, 'AGGREGATION_WINDOW', 60)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.first = localtime().replace(microsecond=0) - timedelta(hours=2)
+
+    def append_alerts_at(self, *alerts):
+        """Append one alert line per (seconds after self.first, src_addr) pair"""
+        with open(self.file_path, 'ab') as file:
+            file.writelines(make_alert_line(1000, src_addr, self.first + timedelta(seconds=seconds))
+                            for seconds, src_addr in alerts)
+
+    def test_alerts_within_window_fold_into_one_event(self):
+        self.append_alerts_at((0, '10.0.0.1'), (5, '10.0.0.2'), (10, '10.0.0.1'), (20, '10.0.0.1'),
+                              (100, '10.0.0.1'))
+        self.read_and_write()
+
+        folded, outside = Event.objects.filter(src_addr='10.0.0.1').order_by('timestamp')
+        self.assertEqual((folded.timestamp, folded.count, folded.last_seen),
+                         (self.first, 3, self.first + timedelta(seconds=20)))
+        self.assertEqual((outside.timestamp, outside.count, outside.last_seen),
+                         (self.first + timedelta(seconds=100), 1, None))
+        self.assertEqual(Event.objects.get(src_addr='10.0.0.2').count, 1)
+
+    def test_alert_of_later_batch_updates_event_and_rollups(self):
+        self.append_alerts_at((0, '10.0.0.1'), (10, '10.0.0.1'))
+        handler = self.read_and_write()
+        self.append_alerts_at((30, '10.0.0.1'), (90, '10.0.0.1'))
+        self.read_and_write(handler)
+
+        folded, outside = Event.objects.order_by('timestamp')
+        self.assertEqual((folded.count, folded.last_seen), (3, self.first + timedelta(seconds=30)))
+        self.assertEqual((outside.count, outside.last_seen), (1, None))
+        self.assertEqual(SidHourlyCount.objects.aggregate(total=Sum('count'))['total'], 4)
+        self.assertEqual(sum(row['count'] for row in count_events('sid')), 4)
+
+
+class ConnectionLossTest(AlertFileMixin, TransactionTestCase):
+    """A connection lost while a batch is inserted makes write_batch retry the batch instead of writing row by row"""
+    def test_connection_lost_during_insert_retries_batch(self):
+        self.append_alerts(3)
+        bulk_create = Event.objects.bulk_create
+        calls = []
+
+        def lose_connection(events):
+            calls.append(len(events))
+            if len(calls) == 1:
+                connection.close()
+                raise OperationalError('server closed the connection unexpectedly')
+            return bulk_create(events)
+
+        with mock.patch.multiple(alert_reader, EVENT_WRITER='orm', RETRY_DELAY=0):
+            with mock.patch.object(Event.objects, 'bulk_create', side_effect=lose_connection):
+                with self.assertLogs('alert_reader', level='WARNING') as logs:
+                    self.read_and_write()
+
+        self.assertEqual(calls, [3, 3])
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('retrying in 0s', logs.output[0])
+        self.assertEqual(Event.objects.count(), 3)
+        checkpoint = ReaderCheckpoint.objects.get(source=alert_reader.CHECKPOINT_SOURCE)
+        self.assertEqual(checkpoint.offset, os.path.getsize(self.file_path))
+
+
+class SocketReaderTest(TransactionTestCase):
+    """SocketReader writes records received on Unix stream and datagram sockets, in its own threads"""
+    def setUp(self):
+        Rule.objects.create(id='1/1000/1', gid=1, sid=1000, rev=1, action='alert', msg='test rule', json={})
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        self.socket_path = os.path.join(work_dir, 'alerts.sock')
+
+    def start_reader(self, socket_type: str) -> alert_reader.SocketReader:
+        """Start a SocketReader on a temporary socket, stopped again at cleanup in case the test fails before stop"""
+        reader = alert_reader.SocketReader(self.socket_path, socket_type)
+        reader.start()
+        self.addCleanup(reader.stop)
+        return reader
+
+    @staticmethod
+    def wait_for_lines(reader: alert_reader.SocketReader, count: int):
+        """Wait up to 5 seconds until the reader has received count records"""
+        deadline = time.monotonic() + 5
+        while reader.metrics.lines_read < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_stream_joins_record_split_across_sends(self):
+        reader = self.start_reader('stream')
+        split_line = make_alert_line(1000, '10.0.0.2')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(self.socket_path)
+            client.sendall(make_alert_line(1000, '10.0.0.1') + split_line[:20])
+            self.wait_for_lines(reader, 1)
+            self.assertEqual(reader.metrics.lines_read, 1)
+
+            incomplete_line = make_alert_line(1000, '10.0.0.4')[:30]
+            client.sendall(split_line[20:] + make_alert_line(1000, '10.0.0.3') + incomplete_line)
+            self.wait_for_lines(reader, 3)
+            with self.assertLogs('alert_reader', level='WARNING') as logs:
+                client.close()
+                deadline = time.monotonic() + 5
+                while reader.source_status()['connections'] and time.monotonic() < deadline:
+                    time.sleep(0.01)
+        reader.stop()
+
+        self.assertIn('Connection closed in the middle of a record', logs.output[0])
+        self.assertEqual(reader.metrics.lines_read, 3)
+        self.assertEqual(reader.metrics.parse_failures, 0)
+        self.assertEqual(sorted(Event.objects.values_list('src_addr', flat=True)), ['10.0.0.1', '10.0.0.2', '10.0.0.3'])
+
+    def test_datagram_holds_records_without_final_newline(self):
+        reader = self.start_reader('datagram')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as client:
+            client.sendto(make_alert_line(1000, '10.0.0.1') + make_alert_line(1000, '10.0.0.2').rstrip(b'\n'),
+                          self.socket_path)
+            client.sendto(make_alert_line(1000, '10.0.0.3'), self.socket_path)
+            self.wait_for_lines(reader, 3)
+        reader.stop()
+
+        self.assertEqual(reader.metrics.lines_read, 3)
+        self.assertEqual(sorted(Event.objects.values_list('src_addr', flat=True)), ['10.0.0.1', '10.0.0.2', '10.0.0.3'])
+
+
+class StaleRuleUpdateJobTest(TestCase):
+    """Rule update jobs whose runner stopped responding are reported as failed and release the lock"""
+    def create_job(self, age: timedelta, heartbeat_age: timedelta = None) -> RuleUpdateJob:
+        """Create an active job created age ago with a heartbeat heartbeat_age ago, no heartbeat if None"""
+        job = RuleUpdateJob.objects.create()
+        heartbeat_at = now() - heartbeat_age if heartbeat_age is not None else None
+        RuleUpdateJob.objects.filter(id=job.id).update(created_at=now() - age, heartbeat_at=heartbeat_at)
+        return job
+
+    def get_status(self, job: RuleUpdateJob) -> str:
+        """Return the status of the job reported by the API"""
+        response = self.client.get(f'/api/v1/update-rules/{job.id}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['status']
+
+    def test_job_without_heartbeat_fails_after_stale_time(self):
+        job = self.create_job(STALE_AFTER * 2)
+        self.assertEqual(self.get_status(job), RuleUpdateJob.FAILED)
+        self.assertFalse(RuleUpdateJob.objects.filter(active=True).exists())
+
+    def test_new_job_without_heartbeat_stays_active(self):
+        job = self.create_job(timedelta(seconds=5))
+        self.assertEqual(self.get_status(job), RuleUpdateJob.QUEUED)
+
+    def test_job_with_old_heartbeat_fails(self):
+        fresh = self.create_job(STALE_AFTER * 3, heartbeat_age=timedelta(seconds=5))
+        self.assertEqual(self.get_status(fresh), RuleUpdateJob.QUEUED)
+
+        RuleUpdateJob.objects.filter(id=fresh.id).update(heartbeat_at=now() - STALE_AFTER * 2)
+        response = self.client.get('/api/v1/update-rules')
+        self.assertEqual(response.json()['status'], RuleUpdateJob.FAILED)
+
+
+class CursorPaginationTest(TestCase):
+    """Cursor pages of the events endpoint follow (timestamp, id) and are not shifted by new events"""
+    def setUp(self):
+        caches[API_CACHE].clear()
+        Rule.objects.create(id='1/1000/1', gid=1, sid=1000, rev=1, action='alert', msg='test rule', json={})
+        start = now().replace(microsecond=0) - timedelta(hours=1)
+        Event.objects.bulk_create(Event(rule_id_id='1/1000/1', timestamp=start + timedelta(seconds=number % 3),
+                                        src_addr='10.0.0.1', dst_addr='192.168.0.1', proto='TCP')
+                                  for number in range(250))
+
+    def read_pages(self, url: str) -> tuple[list, str]:
+        """Follow 'next' from url until a page is empty, return the ids read and the cursor of the empty page"""
+        ids = []
+        while True:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            if not page['results']:
+                return ids, url
+            ids += [event['id'] for event in page['results']]
+            url = page['next']
+
+    def test_pages_follow_timestamp_and_id_with_equal_timestamps(self):
+        ids, _ = self.read_pages('/api/v1/events?pagination=cursor')
+        expected = list(Event.objects.order_by('timestamp', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_new_events_do_not_shift_pages(self):
+        first_page = self.client.get('/api/v1/events?pagination=cursor').json()
+        Event.objects.create(rule_id_id='1/1000/1', timestamp=now() - timedelta(days=1), src_addr='10.0.0.9',
+                             dst_addr='192.168.0.1', proto='TCP')
+        late = Event.objects.create(rule_id_id='1/1000/1', timestamp=now(), src_addr='10.0.0.9',
+                                    dst_addr='192.168.0.1', proto='TCP')
+        DataVersion.bump(DataVersion.EVENTS)
+
+        rest, last_url = self.read_pages(first_page['next'])
+        first_ids = [event['id'] for event in first_page['results']]
+        self.assertEqual(len(first_ids + rest), 251)
+        self.assertEqual(len(set(first_ids + rest)), 251)
+        self.assertEqual(rest[-1], late.id)
+
+        Event.objects.create(rule_id_id='1/1000/1', timestamp=now(), src_addr='10.0.0.9', dst_addr='192.168.0.1',
+                             proto='TCP')
+        DataVersion.bump(DataVersion.EVENTS)
+        self.assertEqual(len(self.client.get(last_url).json()['results']), 1)
+
+    def test_invalid_cursor_is_rejected(self):
+        naive_position = base64.urlsafe_b64encode(json.dumps(['2024-01-01T00:00:00', 1]).encode()).decode()
+        for cursor in ['not a cursor', 'bm90IGpzb24', naive_position]:
+            response = self.client.get('/api/v1/events', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+
+
+class HourlyRollupTest(TestCase):
+    """count_events from the rollups and the partial first hour equals counting the raw events"""
+    def setUp(self):
+        Rule.objects.create(id='1/10/1', gid=1, sid=10, rev=1, action='alert', msg='first rule', json={})
+        Rule.objects.create(id='1/20/1', gid=1, sid=20, rev=1, action='alert', msg='second rule', json={})
+        self.hour = bucket_start(now()) - timedelta(hours=3)
+        events = [Event(rule_id_id='1/10/1' if number % 3 else '1/20/1',
+                        timestamp=self.hour + timedelta(minutes=number * 7),
+                        src_addr=None if number % 5 == 0 else f'10.0.0.{number % 4}', dst_addr='192.168.0.1',
+                        proto='TCP', count=1 + number % 3, is_deleted=number % 11 == 0)
+                  for number in range(30)]
+        Event.objects.bulk_create(events)
+        add_counts((event, event.count) for event in events[:15] if not event.is_deleted)
+        add_counts((event, event.count) for event in events[15:] if not event.is_deleted)
+
+    @staticmethod
+    def count_raw(since) -> tuple[list, list]:
+        """Return the sid and address counts grouped from the live events since, like count_events"""
+        live = Event.objects.live()
+        if since is not None:
+            live = live.filter(timestamp__gte=since)
+        by_sid = live.values('rule_id__sid').annotate(total=Sum('count'))
+        by_addr = live.values('src_addr', 'dst_addr').annotate(total=Sum('count'))
+        return (sorted((row['rule_id__sid'], row['total']) for row in by_sid),
+                sorted((row['src_addr'] or '', row['dst_addr'], row['total']) for row in by_addr))
+
+    def assert_counts_equal_raw(self, since):
+        """Compare count_events by sid and by address with the raw counts"""
+        by_sid, by_addr = self.count_raw(since)
+        self.assertEqual(sorted((row['sid'], row['count']) for row in count_events('sid', since)), by_sid)
+        self.assertEqual(sorted((row['src_addr'] or '', row['dst_addr'], row['count'])
+                                for row in count_events('addr', since)), by_addr)
+
+    def test_all_events(self):
+        self.assert_counts_equal_raw(None)
+
+    def test_period_starting_on_full_hour(self):
+        self.assert_counts_equal_raw(self.hour + timedelta(hours=1))
+
+    def test_period_starting_within_hour(self):
+        for minutes in [1, 14, 29, 30, 59, 61, 125]:
+            with self.subTest(minutes=minutes):
+                self.assert_counts_equal_raw(self.hour + timedelta(minutes=minutes))
+
+
+class DeleteAllEventsTest(TestCase):
+    """PATCH of the events endpoint hides all existing events and leaves events written later visible"""
+    def setUp(self):
+        caches[API_CACHE].clear()
+        Rule.objects.create(id='1/1000/1', gid=1, sid=1000, rev=1, action='alert', msg='test rule', json={})
+        self.write_events(5)
+
+    @staticmethod
+    def write_events(count: int) -> list:
+        """Write count events with their rollups and bump the events version, as alert_reader does"""
+        events = Event.objects.bulk_create(Event(rule_id_id='1/1000/1', timestamp=now(), src_addr='10.0.0.1',
+                                                 dst_addr='192.168.0.1', proto='TCP') for _ in range(count))
+        add_counts((event, event.count) for event in events)
+        DataVersion.bump(DataVersion.EVENTS)
+        return events
+
+    def get_event_ids(self) -> list:
+        """Return the ids of the events listed by the API"""
+        response = self.client.get('/api/v1/events')
+        self.assertEqual(response.status_code, 200)
+        return sorted(event['id'] for event in response.json()['results'])
+
+    def get_sid_counts(self) -> list:
+        """Return the event counts by sid reported by the API"""
+        return self.client.get('/api/v1/events/count', {'type': 'sid'}).json()
+
+    def test_patch_hides_existing_events(self):
+        self.assertEqual(len(self.get_event_ids()), 5)
+        response = self.client.patch('/api/v1/events')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.get_event_ids(), [])
+        self.assertEqual(self.get_sid_counts(), [])
+        self.assertEqual(Event.objects.count(), 5)
+        self.assertEqual(Event.objects.live().count(), 0)
+
+    def test_events_written_after_patch_stay_visible(self):
+        self.client.patch('/api/v1/events')
+        new_events = self.write_events(2)
+
+        self.assertEqual(self.get_event_ids(), sorted(event.id for event in new_events))
+        self.assertEqual(self.get_sid_counts(), [{'sid': 1000, 'count': 2}])
+
+        self.client.patch('/api/v1/events')
+        self.assertEqual(self.get_event_ids(), [])
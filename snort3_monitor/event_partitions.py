@@ -0,0 +1,240 @@
+"""
+Script for time-partitioned storage of events on PostgreSQL (EVENT_PARTITIONING in settings).
+
+    python event_partitions.py convert   converts event_event into a table partitioned by range of timestamp,
+                                         stop alert_reader while it runs
+    python event_partitions.py maintain  creates partitions EVENT_PARTITIONS_AHEAD intervals ahead and drops
+                                         partitions older than EVENT_RETENTION_DAYS, run regularly by scheduler.py
+
+Partitions cover one UTC day or week (EVENT_PARTITION_INTERVAL) and are named after their first day,
+e.g. event_event_p20240115. Events outside of all partitions go to event_event_default and are moved into
+the partition created for their time later. Dropping a partition removes its events without DELETE and vacuum,
+the hourly rollups of its time range are deleted in the same transaction.
+With EVENT_PARTITIONING off or on SQLite the script does nothing and events stay in one table.
+"""
+
+import argparse
+import logging
+import os
+import re
+from datetime import datetime, timedelta, timezone
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "snort3_monitor.settings")
+django.setup()
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from event.models import AddrHourlyCount, DataVersion, Event, SidHourlyCount
+from event.rollups import lock_rollups
+
+partition_logger = logging.getLogger(__name__)
+partition_logger.setLevel(logging.INFO)
+
+f_handler = logging.FileHandler(settings.BASE_DIR.parent / 'log_files' / 'cron.log')
+f_handler.setLevel(logging.INFO)
+f_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+f_handler.setFormatter(f_format)
+
+partition_logger.addHandler(f_handler)
+
+PARTITION_INTERVALS = {'day': timedelta(days=1), 'week': timedelta(weeks=1)}
+PARTITION_BOUNDS = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+TABLE = Event._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+def quote(name: str) -> str:
+    """Quote a table, index or constraint name"""
+    return connection.ops.quote_name(name)
+
+
+def interval_start(moment: datetime) -> datetime:
+    """Return the start of the UTC day or week (from Monday) of EVENT_PARTITION_INTERVAL the moment falls into"""
+    start = moment.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    if settings.EVENT_PARTITION_INTERVAL == 'week':
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def partition_name(start: datetime) -> str:
+    """Return the name of the partition starting at start"""
+    return f'{TABLE}_p{start:%Y%m%d}'
+
+
+def is_partitioned() -> bool:
+    """Return True if event_event is a partitioned table"""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [TABLE])
+        return cursor.fetchone() is not None
+
+
+def list_partitions() -> list:
+    """Return (name, start, end) of the range partitions of event_event ordered by start"""
+    with connection.cursor() as cursor:
+        cursor.execute('''
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass(%s)
+        ''', [TABLE])
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bounds in rows:
+        match = PARTITION_BOUNDS.search(bounds)
+        if match:
+            start, end = (datetime.fromisoformat(bound) for bound in match.groups())
+            partitions.append((name, start, end))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_partition(start: datetime, end: datetime):
+    """
+    Create the partition for events from start to end. Events of the range in the default partition are moved
+    into it before it is attached, as PostgreSQL does not attach a range that the default partition holds rows of.
+    Indexes and constraints of event_event are added to it by ATTACH PARTITION.
+    """
+    name = quote(partition_name(start))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {name} (LIKE {quote(TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(f'''
+            WITH moved AS (
+                DELETE FROM {quote(DEFAULT_PARTITION)} WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        ''', [start, end])
+        cursor.execute(f'ALTER TABLE {quote(TABLE)} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)',
+                       [start, end])
+    partition_logger.info(f'Created partition {partition_name(start)} for {start} - {end}')
+
+
+def create_partitions(until: datetime) -> int:
+    """
+    Create the missing partitions from the end of the latest partition, or from the current interval if there
+    are none, until they cover until. Returns the number of created partitions.
+    """
+    partitions = list_partitions()
+    start = partitions[-1][2] if partitions else interval_start(now())
+    interval = PARTITION_INTERVALS[settings.EVENT_PARTITION_INTERVAL]
+
+    created = 0
+    while start < until:
+        end = interval_start(start) + interval
+        create_partition(start, end)
+        start = end
+        created += 1
+    return created
+
+
+def drop_expired_partitions(before: datetime) -> int:
+    """
+    Drop the partitions whose events are all older than before, together with the hourly rollups of their time
+    ranges, so the rollups stay equal to the remaining events, and bump the events DataVersion.
+    Returns the number of dropped partitions.
+    """
+    dropped = 0
+    for name, start, end in list_partitions():
+        if end > before:
+            break
+        with transaction.atomic():
+            lock_rollups()
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE {quote(name)}')
+            SidHourlyCount.objects.filter(bucket__gte=start, bucket__lt=end).delete()
+            AddrHourlyCount.objects.filter(bucket__gte=start, bucket__lt=end).delete()
+            DataVersion.bump(DataVersion.EVENTS)
+        partition_logger.info(f'Dropped partition {name} of events from {start} to {end}')
+        dropped += 1
+    return dropped
+
+
+def convert():
+    """
+    Convert event_event into a partitioned table in one transaction: the table is renamed, a partitioned table
+    with its columns, primary key (id, timestamp), indexes and foreign keys takes its name, partitions from
+    the oldest event on are created and filled, and the old table is dropped.
+    """
+    interval = PARTITION_INTERVALS[settings.EVENT_PARTITION_INTERVAL]
+    old_table = f'{TABLE}_unpartitioned'
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {quote(TABLE)} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute('SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = %s::regclass '
+                       'AND NOT indisprimary', [TABLE])
+        index_definitions = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass "
+                       "AND contype = 'f'", [TABLE])
+        foreign_keys = cursor.fetchall()
+        cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'", [TABLE])
+        primary_key = cursor.fetchone()[0]
+        cursor.execute(f'SELECT MIN("timestamp") FROM {quote(TABLE)}')
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute(f'ALTER TABLE {quote(TABLE)} RENAME TO {quote(old_table)}')
+        cursor.execute(f'ALTER TABLE {quote(old_table)} RENAME CONSTRAINT {quote(primary_key)} '
+                       f'TO {quote(old_table + "_pkey")}')
+        cursor.execute(f'CREATE TABLE {quote(TABLE)} (LIKE {quote(old_table)} INCLUDING DEFAULTS INCLUDING IDENTITY '
+                       f'INCLUDING CONSTRAINTS) PARTITION BY RANGE ("timestamp")')
+        cursor.execute(f'ALTER TABLE {quote(TABLE)} ADD CONSTRAINT {quote(primary_key)} PRIMARY KEY (id, "timestamp")')
+        cursor.execute(f'CREATE TABLE {quote(DEFAULT_PARTITION)} PARTITION OF {quote(TABLE)} DEFAULT')
+
+        start = interval_start(oldest or now())
+        until = now() + interval * settings.EVENT_PARTITIONS_AHEAD
+        while start < until:
+            end = start + interval
+            create_partition(start, end)
+            start = end
+
+        cursor.execute(f'INSERT INTO {quote(TABLE)} SELECT * FROM {quote(old_table)}')
+        cursor.execute(f'DROP TABLE {quote(old_table)}')
+        for definition in index_definitions:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {quote(TABLE)} ADD CONSTRAINT {quote(name)} {definition}')
+        cursor.execute(f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 0) + 1, false) "
+                       f"FROM {quote(TABLE)}", [TABLE])
+        cursor.execute(f'ANALYZE {quote(TABLE)}')
+
+    partition_logger.info(f'Converted {TABLE} into {len(list_partitions())} partitions '
+                          f'by {settings.EVENT_PARTITION_INTERVAL}')
+
+
+def maintain():
+    """Create partitions EVENT_PARTITIONS_AHEAD intervals ahead and drop partitions older than EVENT_RETENTION_DAYS"""
+    interval = PARTITION_INTERVALS[settings.EVENT_PARTITION_INTERVAL]
+    created = create_partitions(now() + interval * settings.EVENT_PARTITIONS_AHEAD)
+    dropped = 0
+    if settings.EVENT_RETENTION_DAYS:
+        dropped = drop_expired_partitions(now() - timedelta(days=settings.EVENT_RETENTION_DAYS))
+    partition_logger.info(f'Partition maintenance created {created} and dropped {dropped} partitions')
+
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Manage time partitions of the events table on PostgreSQL')
+    parser.add_argument('command', choices=['convert', 'maintain'],
+                        help='convert event_event into a partitioned table or create and drop partitions')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if not settings.EVENT_PARTITIONING:
+        partition_logger.info('Event partitioning is disabled by EVENT_PARTITIONING')
+    elif connection.vendor != 'postgresql':
+        partition_logger.warning(f'Event partitioning needs PostgreSQL, the database is {connection.vendor}')
+    elif args.command == 'convert':
+        if is_partitioned():
+            partition_logger.info(f'{TABLE} is partitioned already')
+        else:
+            convert()
+    elif not is_partitioned():
+        partition_logger.warning(f'{TABLE} is not partitioned, run "event_partitions.py convert" first')
+    else:
+        try:
+            maintain()
+        except Exception as e:
+            partition_logger.error(f'An error occurred during partition maintenance {e}')
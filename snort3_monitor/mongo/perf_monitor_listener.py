@@ -1,25 +1,33 @@
 import logging
 from datetime import datetime
+from pathlib import Path
 
-from db_config import perf_monitor
+try:
+    from mongo.db_config import perf_monitor
+except ModuleNotFoundError:
+    from db_config import perf_monitor
 import json
 
 
-logging.basicConfig(
-    level=logging.ERROR,
-    filename='/usr/src/event-monitor-snort3/log_files/perf_monitor_listener.log',
-    filemode='a',
-    format='{asctime} - {name} - {levelname} - {message}',
-    style='{'
-)
+PROJECT_DIR = Path(__file__).resolve().parent.parent.parent
+
+perf_monitor_logger = logging.getLogger(__name__)
+perf_monitor_logger.setLevel(logging.ERROR)
+
+f_handler = logging.FileHandler(PROJECT_DIR / 'log_files' / 'perf_monitor_listener.log')
+f_handler.setLevel(logging.ERROR)
+f_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+f_handler.setFormatter(f_format)
+perf_monitor_logger.addHandler(f_handler)
 
 
 def read_perf_monitor_logs():
     """
        Read performance monitor logs from a JSON file and insert into the database.
+       Errors are logged and raised, so that scheduler.py counts the run as failed.
     """
     try:
-        with open('/usr/src/event-monitor-snort3/snort_logs/perf_monitor_base.json', 'r') as file:
+        with open(PROJECT_DIR / 'snort_logs' / 'perf_monitor_base.json', 'r') as file:
             json_content = file.read()
             if not json_content.endswith(']'):
                 json_content += ']'
@@ -32,11 +40,14 @@ def read_perf_monitor_logs():
                     perf_monitor.insert_one(document)
 
     except FileNotFoundError:
-        logging.error("File not found. Please check the file path.")
+        perf_monitor_logger.error("File not found. Please check the file path.")
+        raise
     except json.JSONDecodeError:
-        logging.error("Error decoding JSON. Please check the file content.")
+        perf_monitor_logger.error("Error decoding JSON. Please check the file content.")
+        raise
     except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
+        perf_monitor_logger.error(f"An unexpected error occurred: {e}")
+        raise
 
 
 if __name__ == '__main__':
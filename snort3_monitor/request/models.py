@@ -19,3 +19,8 @@ class RequestLog(models.Model):
     response_status_code = models.IntegerField()
     endpoint = models.CharField()
     request_data = models.JSONField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp'], name='request_log_timestamp_idx'),
+        ]
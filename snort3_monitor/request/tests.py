@@ -1,3 +1,33 @@
+from datetime import timedelta
+
 from django.test import TestCase
+from django.utils.timezone import localtime, now
+
+from request.models import RequestLog
+
+
+class RequestListETagTest(TestCase):
+    """Polls of requests-log do not change its ETag, logs of other endpoints do"""
+    def setUp(self):
+        RequestLog.objects.create(timestamp=now(), user_ip='127.0.0.1', http_method='GET',
+                                  response_status_code=200, endpoint='/api/v1/events', request_data={})
+        today = localtime().date()
+        self.params = {'period_start': str(today - timedelta(days=1)), 'period_end': str(today + timedelta(days=1))}
+
+    def get(self, **headers):
+        return self.client.get('/api/v1/requests-log', self.params, **headers)
+
+    def test_repeated_get_is_not_modified(self):
+        first = self.get()
+        self.assertEqual(first.status_code, 200)
+        second = self.get(HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(RequestLog.objects.filter(endpoint='/api/v1/requests-log').count(), 2)
 
-# Create your tests here.
+    def test_other_endpoint_log_changes_etag(self):
+        first = self.get()
+        RequestLog.objects.create(timestamp=now(), user_ip='127.0.0.1', http_method='GET',
+                                  response_status_code=200, endpoint='/api/v1/rules', request_data={})
+        second = self.get(HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
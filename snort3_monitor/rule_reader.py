@@ -1,13 +1,17 @@
 import os
+import hashlib
 import json
 import subprocess
+import tempfile
 import django
 import logging
 
+from django.db import DatabaseError, connection, transaction
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "snort3_monitor.settings")
 django.setup()
 
-from event.models import Rule
+from event.models import DataVersion, Rule
 
 
 logging.basicConfig(level=logging.ERROR,
@@ -17,53 +21,198 @@ logging.basicConfig(level=logging.ERROR,
                     style='{'
                     )
 
+RULE_BATCH_SIZE = 1000
+PIPE_BUFFER_SIZE = 65536
+STDERR_LOG_SIZE = 4096
+SNORT_DUMP_COMMAND = ['snort', '-c', 'configs/custom_snort.lua', '--dump-rule-meta']
+
+
+class SnortDumpError(Exception):
+    """Raised when Snort fails to dump the rule metadata"""
+    pass
+
 
 def rule_reader():
     """
-    Executes Snort command, processes the output, and writes entries to the database.
-    Deletes the temporary output file after processing.
-    """
-    output_file_path = 'rules/snort_rules.json'
-    command = f'snort -c configs/custom_snort.lua --dump-rule-meta > {output_file_path}'
+    Executes Snort command and writes new rules to the database while reading its output.
+
+    The rule metadata is read line by line from the stdout pipe of Snort, so no temporary file is written and
+    at most RULE_BATCH_SIZE rules are held in memory. Stderr goes to a temporary file, so a chatty Snort
+    cannot block on a full pipe. If Snort exits with an error, the synchronization is rolled back and
+    the end of its stderr is logged.
 
+    :return: counts of added, unchanged and failed rules or None if Snort failed
+    """
     try:
-        subprocess.run(command, check=True, shell=True)
-        print('Snort command executed successfully.')
-    except subprocess.CalledProcessError as e:
-        logging.error('Error while dumping Snort rules to json:', e.stderr)
+        with transaction.atomic():
+            counts = stream_rules(SNORT_DUMP_COMMAND)
+    except (OSError, SnortDumpError) as e:
+        logging.error(f'Error while dumping Snort rules: {e}')
+        print(f'Error while dumping Snort rules: {e}')
+        return None
+
+    print('Snort command executed successfully.')
+    print_counts(counts)
+    return counts
 
-    process_and_write_to_db(output_file_path)
 
+def print_counts(counts: dict):
+    """Prints the result of a synchronization"""
+    print(f"Entries were written to DB: {counts['added']} added, {counts['updated']} updated, "
+          f"{counts['unchanged']} unchanged, {counts['failed']} failed")
 
-def process_and_write_to_db(output_file_path):
+
+def stream_rules(command: list, on_progress=None) -> dict:
+    """
+    Runs command and synchronizes the rules it prints with the database, must be called in a transaction.
+
+    :param command: command printing --dump-rule-meta lines to stdout
+    :param on_progress: passed to sync_rules
+    :return: counts of added, unchanged and failed rules
+    :raise SnortDumpError: if the command exits with a non-zero status
     """
-    Reads the Snort rules from the specified file, extracts relevant data,
-    and writes new entries to the Rule model in the Django database.
-    Deletes the temporary output file after processing.
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr, bufsize=PIPE_BUFFER_SIZE,
+                                   encoding='utf-8', errors='replace')
+        try:
+            counts = sync_rules(process.stdout, on_progress)
+            returncode = process.wait()
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+        if returncode != 0:
+            stderr.seek(max(stderr.tell() - STDERR_LOG_SIZE, 0))
+            message = stderr.read().decode(errors='replace').strip()
+            raise SnortDumpError(f'exit status {returncode}: {message}')
+    return counts
+
+
+def parse_rule(line: str) -> Rule:
+    """Creates an unsaved Rule from one line of --dump-rule-meta output"""
+    rule_data = json.loads(line)
+    gid = rule_data["gid"]
+    sid = rule_data["sid"]
+    rev = rule_data["rev"]
+    content_hash = hashlib.blake2b(line.rstrip('\n').encode(), digest_size=16).hexdigest()
+    return Rule(id=f'{gid}/{sid}/{rev}', gid=gid, sid=sid, rev=rev, action=rule_data["action"],
+                msg=rule_data["msg"], json=line, content_hash=content_hash)
+
+
+def sync_rules(lines, on_progress=None) -> dict:
     """
-    with open(output_file_path, 'r', encoding='utf-8', errors='replace') as f:
-        all_lines = f.readlines()
+    Writes new and changed rules to the database.
 
-        for line in all_lines:
-            rule_data = json.loads(line)
-            gid = rule_data["gid"]
-            sid = rule_data["sid"]
-            rev = rule_data["rev"]
-            action = rule_data["action"]
-            msg = rule_data["msg"]
-            jsn = line
+    Keys and content hashes of the stored rules are read with one query and compared in memory, so only rules
+    that are new or whose entry changed are written. New rules are inserted with bulk_create and changed ones
+    updated by update_rules in batches of RULE_BATCH_SIZE inside one transaction. A rejected batch is retried
+    row by row, so only invalid rules fail. The rules version is bumped only if rules were written.
 
-            if not Rule.objects.filter(gid=gid, sid=sid, rev=rev):
-                try:
-                    Rule.objects.create(gid=gid, sid=sid, rev=rev, action=action, msg=msg, json=jsn)
-                except Exception as e:
-                    logging.error(f"Error writing to DB: {e}")
+    :param lines: iterable of --dump-rule-meta lines
+    :param on_progress: optional function called with the number of read lines after every RULE_BATCH_SIZE lines
+    :return: counts of added, updated, unchanged and failed rules
+    """
+    counts = {'added': 0, 'updated': 0, 'unchanged': 0, 'failed': 0}
+    stored = dict(Rule.objects.values_list('id', 'content_hash'))
+    seen = set()
+    new_rules, changed_rules = [], []
+    processed = 0
+
+    with transaction.atomic():
+        for line in lines:
+            processed += 1
+            if on_progress is not None and processed % RULE_BATCH_SIZE == 0:
+                on_progress(processed)
+            if not line.strip():
+                continue
+
+            try:
+                rule = parse_rule(line)
+            except (KeyError, TypeError, ValueError) as e:
+                logging.error(f"Error reading rule {line.strip()}: {e}")
+                counts['failed'] += 1
+                continue
+
+            if rule.id in seen or stored.get(rule.id) == rule.content_hash:
+                counts['unchanged'] += 1
+            elif rule.id in stored:
+                changed_rules.append(rule)
+            else:
+                new_rules.append(rule)
+            seen.add(rule.id)
+
+            if len(new_rules) >= RULE_BATCH_SIZE:
+                write_rules(new_rules, counts)
+                new_rules = []
+            if len(changed_rules) >= RULE_BATCH_SIZE:
+                update_rules(changed_rules, counts)
+                changed_rules = []
+        write_rules(new_rules, counts)
+        update_rules(changed_rules, counts)
+        if on_progress is not None:
+            on_progress(processed)
+
+        if counts['added'] or counts['updated']:
+            DataVersion.bump(DataVersion.RULES)
+    return counts
+
+
+def write_rules(rules: list, counts: dict):
+    """Inserts a batch of new rules, falling back to one savepoint per rule if the batch is rejected"""
+    if not rules:
+        return
 
-        print('Entries were written to DB')
+    try:
+        with transaction.atomic():
+            Rule.objects.bulk_create(rules)
+        counts['added'] += len(rules)
+        return
+    except DatabaseError as e:
+        logging.error(f"Error writing batch of {len(rules)} rules to DB, retrying one by one: {e}")
+
+    for rule in rules:
+        try:
+            with transaction.atomic():
+                rule.save()
+            counts['added'] += 1
+        except DatabaseError as e:
+            logging.error(f"Error writing rule {rule.id} to DB: {e}")
+            counts['failed'] += 1
+
+
+def update_rules(rules: list, counts: dict):
+    """
+    Updates a batch of changed rules with one parameterized UPDATE statement per rule sent with executemany,
+    which avoids building the CASE expressions of bulk_update. Falls back to one savepoint per rule
+    if the batch is rejected.
+    """
+    if not rules:
+        return
 
-        os.remove(output_file_path)
+    fields = [Rule._meta.get_field(name) for name in ['action', 'msg', 'json', 'content_hash']]
+    assignments = ', '.join(f'{connection.ops.quote_name(field.column)} = %s' for field in fields)
+    sql = f'UPDATE {connection.ops.quote_name(Rule._meta.db_table)} SET {assignments} WHERE id = %s'
+    params = [[field.get_db_prep_save(getattr(rule, field.attname), connection) for field in fields] + [rule.id]
+              for rule in rules]
 
-        print('snort_rules.json was deleted')
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+        counts['updated'] += len(rules)
+        return
+    except DatabaseError as e:
+        logging.error(f"Error updating batch of {len(rules)} rules in DB, retrying one by one: {e}")
+
+    for rule in rules:
+        try:
+            with transaction.atomic():
+                rule.save(update_fields=[field.name for field in fields])
+            counts['updated'] += 1
+        except DatabaseError as e:
+            logging.error(f"Error updating rule {rule.id} in DB: {e}")
+            counts['failed'] += 1
 
 
 if __name__ == "__main__":
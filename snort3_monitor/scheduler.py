@@ -0,0 +1,222 @@
+"""
+Daemon running the periodic jobs of the monitor in one process, managed by supervisord:
+
+    clear_deleted_events   deletes events removed by users, see clear_deleted_events.py
+    perf_monitor_listener  copies Snort perf_monitor records to MongoDB, see mongo/perf_monitor_listener.py
+    event_partitions       creates and drops time partitions of events, see event_partitions.py
+
+Every job runs in its own thread, which keeps its database and MongoDB connections between runs, so a run
+pays neither for interpreter startup and django.setup() nor for new connections. A job never overlaps itself:
+runs whose time passed while the previous run was still going are skipped and counted. Intervals and jitter
+come from SCHEDULER_JOBS, timing stats of the jobs are written to SCHEDULER_STATUS_FILE for the API.
+"""
+
+import json
+import logging
+import os
+import random
+import signal
+import threading
+import time
+from datetime import timedelta
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "snort3_monitor.settings")
+django.setup()
+
+from django.conf import settings
+from django.db import connection
+from django.utils.timezone import now
+
+import event_partitions
+from clear_deleted_events import purge_deleted_events
+from mongo.perf_monitor_listener import read_perf_monitor_logs
+
+scheduler_logger = logging.getLogger(__name__)
+scheduler_logger.setLevel(logging.INFO)
+
+f_handler = logging.FileHandler(settings.BASE_DIR.parent / 'log_files' / 'scheduler.log')
+f_handler.setLevel(logging.INFO)
+f_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+f_handler.setFormatter(f_format)
+
+scheduler_logger.addHandler(f_handler)
+
+STATUS_INTERVAL = 5
+
+
+def maintain_partitions():
+    """Create and drop event partitions if event_event is partitioned, see event_partitions.py"""
+    if settings.EVENT_PARTITIONING and connection.vendor == 'postgresql' and event_partitions.is_partitioned():
+        event_partitions.maintain()
+
+
+JOB_FUNCTIONS = {
+    'clear_deleted_events': purge_deleted_events,
+    'perf_monitor_listener': read_perf_monitor_logs,
+    'event_partitions': maintain_partitions,
+}
+
+
+class Job:
+    """
+    Periodic job run by its own thread every interval seconds, each run delayed by up to jitter seconds.
+
+    Attributes:
+    - name (str): name of the job in SCHEDULER_JOBS
+    - function (callable): function called by every run
+    - interval (float): seconds between the scheduled starts of two runs
+    - jitter (float): largest random delay added to a scheduled start
+    - runs (int): finished runs
+    - failures (int): runs that raised an exception
+    - skipped (int): scheduled runs dropped because the previous run was still going
+    - running (bool): True while a run is going
+    - last_started_at (datetime): start of the last run
+    - last_finished_at (datetime): end of the last finished run
+    - next_run_at (datetime): time the next run is due
+    - last_duration (float): seconds the last finished run took
+    - max_duration (float): seconds the longest run took
+    - total_duration (float): seconds all finished runs took
+    - last_error (str): exception of the last run, None if it succeeded
+    """
+    def __init__(self, name: str, function, interval: float, jitter: float):
+        self.name = name
+        self.function = function
+        self.interval = interval
+        self.jitter = jitter
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.running = False
+        self.last_started_at = None
+        self.last_finished_at = None
+        self.next_run_at = None
+        self.last_duration = None
+        self.max_duration = None
+        self.total_duration = 0.0
+        self.last_error = None
+        self._thread = None
+
+    def start(self, stopping: threading.Event):
+        """Starts the thread of the job, which runs it until stopping is set"""
+        self._thread = threading.Thread(target=self.run_periodically, args=(stopping,), name=f'job-{self.name}')
+        self._thread.start()
+
+    def join(self):
+        """Waits until the current run of the job is finished after stopping was set"""
+        self._thread.join()
+
+    def run_periodically(self, stopping: threading.Event):
+        """Job thread: runs the job at every scheduled start plus jitter until stopping is set"""
+        scheduled = time.monotonic()
+        while True:
+            delay = max(scheduled + random.uniform(0, self.jitter) - time.monotonic(), 0)
+            self.next_run_at = now() + timedelta(seconds=delay)
+            if stopping.wait(delay):
+                break
+
+            self.run()
+            scheduled += self.interval
+            while scheduled <= time.monotonic():
+                scheduled += self.interval
+                self.skipped += 1
+
+        connection.close()
+
+    def run(self):
+        """Runs the job once and records its duration, an exception is logged and counted as a failure"""
+        self.running = True
+        self.last_started_at = now()
+        started = time.monotonic()
+        try:
+            self.function()
+            self.last_error = None
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f'{type(e).__name__}: {e}'
+            scheduler_logger.exception(f'Job {self.name} failed: {e}')
+            connection.close()
+
+        duration = time.monotonic() - started
+        self.runs += 1
+        self.total_duration += duration
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration or 0, duration)
+        self.last_finished_at = now()
+        self.running = False
+
+    def to_dict(self) -> dict:
+        """Returns settings and timing stats of the job"""
+        def isoformat(moment):
+            return moment.isoformat() if moment else None
+
+        def seconds(value):
+            return round(value, 3) if value is not None else None
+
+        return {
+            'interval': self.interval,
+            'jitter': self.jitter,
+            'running': self.running,
+            'runs': self.runs,
+            'failures': self.failures,
+            'skipped': self.skipped,
+            'last_started_at': isoformat(self.last_started_at),
+            'last_finished_at': isoformat(self.last_finished_at),
+            'next_run_at': isoformat(self.next_run_at),
+            'last_duration': seconds(self.last_duration),
+            'average_duration': seconds(self.total_duration / self.runs) if self.runs else None,
+            'max_duration': seconds(self.max_duration),
+            'last_error': self.last_error,
+        }
+
+
+def create_jobs() -> list:
+    """Returns the jobs of SCHEDULER_JOBS with an interval, unknown job names are logged and ignored"""
+    jobs = []
+    for name, options in settings.SCHEDULER_JOBS.items():
+        if name not in JOB_FUNCTIONS:
+            scheduler_logger.warning(f'Unknown job {name} in SCHEDULER_JOBS, known jobs: {", ".join(JOB_FUNCTIONS)}')
+        elif options.get('interval'):
+            jobs.append(Job(name, JOB_FUNCTIONS[name], options['interval'], options.get('jitter', 0)))
+    return jobs
+
+
+def publish_status(jobs: list, started_at):
+    """Writes the stats of the jobs to settings.SCHEDULER_STATUS_FILE, replacing it atomically"""
+    status = {
+        'published_at': now().isoformat(),
+        'started_at': started_at.isoformat(),
+        'jobs': {job.name: job.to_dict() for job in jobs},
+    }
+
+    temp_path = f'{settings.SCHEDULER_STATUS_FILE}.tmp'
+    try:
+        with open(temp_path, 'w') as file:
+            json.dump(status, file)
+        os.replace(temp_path, settings.SCHEDULER_STATUS_FILE)
+    except OSError as e:
+        scheduler_logger.error(f'Error publishing scheduler status: {e}')
+
+
+if __name__ == '__main__':
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+
+    started_at = now()
+    jobs = create_jobs()
+    for job in jobs:
+        job.start(stopping)
+    scheduler_logger.info(f'Scheduler started with jobs: {", ".join(job.name for job in jobs)}')
+
+    try:
+        while not stopping.wait(STATUS_INTERVAL):
+            publish_status(jobs, started_at)
+    except KeyboardInterrupt:
+        scheduler_logger.info('KeyboardInterrupt')
+        stopping.set()
+
+    for job in jobs:
+        job.join()
+    publish_status(jobs, started_at)
+    scheduler_logger.info('Scheduler stopped')
@@ -142,6 +142,37 @@ CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:8080",
 ]
 
+# Cache of API responses, see api/cache.py. Responses are keyed on the DataVersion of the data they read,
+# so a change is never hidden by the cache. To share the cache between server processes use Redis, e.g.
+# 'api': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://redis:6379/1'}
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'api': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'OPTIONS': {'MAX_ENTRIES': 1000}},
+}
+API_CACHE_TIMEOUT = 300
+API_CACHE_COUNT_SLOT = 60
+
+# Status of alert_reader, written by the reader and served by the ingest-status endpoint
+INGEST_STATUS_FILE = BASE_DIR.parent / 'snort_logs' / 'ingest_status.json'
+
+# Seconds during which alert_reader folds identical alerts into one event, 0 writes every alert as an event
+ALERT_AGGREGATION_WINDOW = 0
+
+# Time partitions of event_event on PostgreSQL, see event_partitions.py
+EVENT_PARTITIONING = False
+EVENT_PARTITION_INTERVAL = 'day'
+EVENT_PARTITIONS_AHEAD = 7
+EVENT_RETENTION_DAYS = None
+
+# Periodic jobs of scheduler.py: seconds between runs and the largest random delay added to a run,
+# a job with interval 0 is not run
+SCHEDULER_JOBS = {
+    'clear_deleted_events': {'interval': 60, 'jitter': 5},
+    'perf_monitor_listener': {'interval': 60, 'jitter': 5},
+    'event_partitions': {'interval': 3600, 'jitter': 60},
+}
+SCHEDULER_STATUS_FILE = BASE_DIR.parent / 'snort_logs' / 'scheduler_status.json'
+
 try:
     from .local_settings import *
 except ImportError: